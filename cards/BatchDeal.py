@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+from array import array
+import random
+
+try:
+    import numpy
+except ImportError:
+    # If not present, decks are shuffled one at a time into arrays
+    numpy = None
+
+from PackedDeck import PackedDeck, Card
+
+class BatchDeal:
+    """Shuffle and deal many independent copies of one deck at once
+
+    Decks are handled as the packed card values of a PackedDeck. With
+    numpy available, all of the decks are shuffled and dealt as one
+    matrix of unsigned shorts; otherwise each deck is its own array.
+    """
+
+    def __init__(self, cards:Card=[], rng=None):
+        """Set up the deck to be copied, parameters are:
+
+        cards: an iterator of Card instances
+        rng: a random.Random (or similar) for shuffling; with numpy it
+             only seeds numpy's own generator
+        """
+        self.deck = PackedDeck(cards, rng=rng)
+        self.rng = self.deck.rng
+
+        if numpy:
+            self._codes = numpy.asarray(self.deck._cards, dtype=numpy.uint16)
+            self._generator = numpy.random.default_rng(self.rng.getrandbits(128))
+        else:
+            self._codes = self.deck._cards
+
+
+    def size(self):
+        return len(self._codes)
+
+
+    def shuffle(self, decks:int):
+        """Return a number of independently shuffled decks, one per row.
+
+        As with Deck, the last card in each row is the top of the deck.
+        """
+        if numpy:
+            rows = numpy.tile(self._codes, (decks, 1))
+            return(self._generator.permuted(rows, axis=1, out=rows))
+
+        rows = []
+        for deck in range(decks):
+            row = array("H", self._codes)
+            self.rng.shuffle(row)
+            rows.append(row)
+        return(rows)
+
+
+    def hands(self, rows, players:int, qty:int):
+        """Deal each row of shuffled decks the way Deck.deal does.
+
+        Returns hands indexed by [deck][player], each one a sequence of
+        qty packed cards: a (decks, players, qty) matrix with numpy, or
+        lists of arrays without it.
+        """
+        dealt = players * qty
+        if dealt > self.size():
+            raise ValueError("Not enough cards to deal")
+
+        if numpy:
+            top = numpy.asarray(rows)[:, :-1 * (dealt + 1):-1]
+            return(top.reshape(len(top), qty, players).transpose(0, 2, 1))
+
+        return([[row[-1 - player : -1 * (dealt + 1) : -1 * players]
+                 for player in range(players)]
+                for row in rows])
+
+
+    def deal(self, decks:int, players:int, qty:int):
+        """Shuffle a number of decks and deal out each one"""
+        return(self.hands(self.shuffle(decks), players, qty))
+
+###
+
+import unittest
+
+from Deck import Deck
+
+class TestBatchDeal(unittest.TestCase):
+
+    CARDS = [Card(r, s) for s in range(1, 5) for r in range(1, 14)]
+
+    def test_shuffle(self):
+        batch = BatchDeal(TestBatchDeal.CARDS)
+        rows = batch.shuffle(10)
+
+        self.assertEqual(len(rows), 10, "Wrong number of decks")
+
+        original = sorted(batch.deck._cards)
+        for row in rows:
+            self.assertEqual(sorted(row), original, "Same cards after mixing")
+
+        self.assertNotEqual(list(rows[0]), list(rows[1]), "Decks should be mixed independently")
+
+
+    def test_replay(self):
+        first  = BatchDeal(TestBatchDeal.CARDS, rng=random.Random(7)).deal(4, 2, 5)
+        second = BatchDeal(TestBatchDeal.CARDS, rng=random.Random(7)).deal(4, 2, 5)
+
+        self.assertEqual([[list(hand) for hand in hands] for hands in first],
+                         [[list(hand) for hand in hands] for hands in second],
+                         "Same seed should deal the same hands")
+
+
+    def test_hands_match_deck(self):
+        batch = BatchDeal(TestBatchDeal.CARDS)
+        rows = batch.shuffle(3)
+        dealt = batch.hands(rows, players=4, qty=5)
+
+        for row, hands in zip(rows, dealt):
+            expected = Deck(list(row)).deal(players=4, qty=5)
+            self.assertEqual([[int(c) for c in hand] for hand in hands],
+                             expected,
+                             "Hands should match a single deck deal")
+
+
+    def test_deal(self):
+        batch = BatchDeal(TestBatchDeal.CARDS)
+        dealt = batch.deal(decks=5, players=3, qty=7)
+
+        self.assertEqual(len(dealt), 5, "Wrong number of decks")
+        for hands in dealt:
+            self.assertEqual([len(hand) for hand in hands], [7, 7, 7], "Wrong hand sizes")
+            cards = [int(c) for hand in hands for c in hand]
+            self.assertEqual(len(set(cards)), 21, "Cards dealt twice")
+
+        hand = batch.deck.cards(dealt[0][0])
+        self.assertTrue(all(isinstance(card, Card) for card in hand), "Cards made on demand")
+
+        self.assertRaises(ValueError, batch.deal, 1, 6, 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+from math import comb
+import multiprocessing
+
+from Deck import Card
+
+class DealEnumerator:
+    """Walk every distinct deal of a small deck, for exact probabilities
+
+    A deal is what Deck.deal(players, qty) hands out: a set of qty cards
+    for each player. Deals are numbered 0 to count()-1 with a mixed-radix
+    number whose digits are each player's combination of the cards left
+    after the players before them, and each combination is numbered in
+    the combinatorial number system (colex order). Any deal can be found
+    straight from its number, so the range can be split across workers
+    without listing the deals before it.
+    """
+
+    def __init__(self, cards:Card, players:int, qty:int):
+        """Set up the deals, parameters are:
+
+        cards: a list of Card instances (or anything else)
+        players: number of hands dealt
+        qty: number of cards in each hand
+        """
+        self.cards = list(cards)
+        self.players = players
+        self.qty = qty
+
+        if players < 1 or qty < 0 or players * qty > len(self.cards):
+            raise ValueError("Not enough cards to deal")
+
+        # radix for each player's digit: the ways to choose their hand
+        self._radices = [comb(len(self.cards) - player * qty, qty) for player in range(players)]
+
+
+    def count(self):
+        """Number of distinct deals"""
+        total = 1
+        for radix in self._radices:
+            total *= radix
+        return(total)
+
+
+    @staticmethod
+    def _unrank_combination(rank:int, qty:int):
+        """Positions c[0] < ... < c[qty-1] with rank = sum of comb(c[i], i+1)"""
+        positions = [0] * qty
+        for size in range(qty, 0, -1):
+            position = size - 1
+            while comb(position + 1, size) <= rank:
+                position += 1
+            positions[size - 1] = position
+            rank -= comb(position, size)
+        return(positions)
+
+
+    @staticmethod
+    def _next_combination(positions, available:int):
+        """Step positions to the next combination in colex order, in
+        place. Returns False, leaving them alone, after the last one."""
+        qty = len(positions)
+        for i in range(qty):
+            limit = positions[i + 1] if i + 1 < qty else available
+            if positions[i] + 1 < limit:
+                positions[i] += 1
+                for j in range(i):
+                    positions[j] = j
+                return(True)
+        return(False)
+
+
+    def _digits(self, rank:int):
+        """Split a deal number into each player's combination number"""
+        digits = []
+        for radix in reversed(self._radices):
+            rank, digit = divmod(rank, radix)
+            digits.append(digit)
+        return(digits[::-1])
+
+
+    def _split(self, combinations):
+        """Turn each player's positions (among the cards the players
+        before them left) into hands of cards, also returning the cards
+        left over"""
+        remaining = self.cards
+        hands = []
+        for positions in combinations:
+            chosen = set(positions)
+            hands.append(tuple(remaining[p] for p in positions))
+            remaining = [card for p, card in enumerate(remaining) if p not in chosen]
+        return(tuple(hands), remaining)
+
+
+    def unrank(self, rank:int):
+        """Return the deal with a given number, as a tuple of hands"""
+        if not 0 <= rank < self.count():
+            raise IndexError("No such deal")
+        return(self._split([DealEnumerator._unrank_combination(digit, self.qty)
+                            for digit in self._digits(rank)])[0])
+
+
+    def deals(self, start:int=0, stop:int=None):
+        """Yield the deals numbered start up to (not including) stop"""
+        stop = self.count() if stop is None else min(stop, self.count())
+        if start >= stop:
+            return
+
+        combinations = [DealEnumerator._unrank_combination(digit, self.qty)
+                        for digit in self._digits(start)]
+
+        # The hands before the last player only change when the last
+        # player's combinations run out, so remember what they leave
+        last = self.players - 1
+        head, remaining = self._split(combinations[:last])
+        available = len(remaining)
+
+        for rank in range(start, stop):
+            yield(head + (tuple(remaining[p] for p in combinations[last]),))
+
+            if not DealEnumerator._next_combination(combinations[last], available):
+                # carry into the earlier players, resetting the later ones
+                player = last - 1
+                while player >= 0:
+                    if DealEnumerator._next_combination(combinations[player],
+                                                        len(self.cards) - player * self.qty):
+                        break
+                    player -= 1
+                if player < 0:
+                    return # that was the last deal
+                for later in range(player + 1, self.players):
+                    combinations[later] = list(range(self.qty))
+
+                head, remaining = self._split(combinations[:last])
+
+
+    def reduce(self, reducer, initial, start:int=0, stop:int=None):
+        """Fold reducer(result, deal) over a range of deals"""
+        result = initial
+        for deal in self.deals(start, stop):
+            result = reducer(result, deal)
+        return(result)
+
+
+    def reduce_parallel(self, reducer, initial, combine, workers:int=None):
+        """Split the deals into one range per worker process, fold each
+        with reducer starting from initial, and merge the results in
+        order with combine(a, b). The reducer and combine functions must
+        be picklable, so defined at the top level of a module."""
+        workers = workers or multiprocessing.cpu_count()
+        total = self.count()
+        bounds = [total * worker // workers for worker in range(workers + 1)]
+        jobs = [(self, reducer, initial, bounds[w], bounds[w + 1])
+                for w in range(workers) if bounds[w] < bounds[w + 1]]
+
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.map(_reduce_range, jobs)
+
+        result = results[0]
+        for other in results[1:]:
+            result = combine(result, other)
+        return(result)
+
+
+def _reduce_range(job):
+    # Pool.map only hands over a single argument
+    enumerator, reducer, initial, start, stop = job
+    return(enumerator.reduce(reducer, initial, start, stop))
+
+###
+
+import unittest
+
+def _count_high_first(counts, deal):
+    """Reducer for testing: count deals where the first hand holds the
+    highest card"""
+    best = max(max(card.rank for card in hand) for hand in deal)
+    if max(card.rank for card in deal[0]) == best:
+        counts[0] += 1
+    counts[1] += 1
+    return(counts)
+
+def _add_counts(first, second):
+    return([a + b for a, b in zip(first, second)])
+
+class TestDealEnumerator(unittest.TestCase):
+
+    CARDS = [Card(r) for r in range(1, 8)]
+
+    def test_count(self):
+        self.assertEqual(DealEnumerator(self.CARDS, 2, 2).count(), 21 * 10, "Wrong number of deals")
+        self.assertEqual(DealEnumerator(self.CARDS, 3, 1).count(), 7 * 6 * 5, "Wrong number of deals")
+        self.assertRaises(ValueError, DealEnumerator, self.CARDS, 4, 2)
+
+    def test_every_deal_once(self):
+        enumerator = DealEnumerator(self.CARDS, 2, 3)
+        deals = list(enumerator.deals())
+
+        self.assertEqual(len(deals), enumerator.count(), "Every deal should be walked")
+        as_ranks = set(tuple(frozenset(c.rank for c in hand) for hand in deal) for deal in deals)
+        self.assertEqual(len(as_ranks), len(deals), "Deals should be distinct")
+
+        for deal in deals:
+            self.assertEqual([len(hand) for hand in deal], [3, 3], "Wrong hand sizes")
+            self.assertEqual(len(set(id(c) for hand in deal for c in hand)), 6, "Cards dealt twice")
+
+    def test_unrank_matches_walk(self):
+        enumerator = DealEnumerator(self.CARDS, 3, 2)
+        for rank, deal in enumerate(enumerator.deals()):
+            self.assertEqual(deal, enumerator.unrank(rank), "Deal %d does not match" % rank)
+        self.assertRaises(IndexError, enumerator.unrank, enumerator.count())
+
+    def test_ranges(self):
+        enumerator = DealEnumerator(self.CARDS, 2, 2)
+        whole = list(enumerator.deals())
+        parts = list(enumerator.deals(0, 37)) + list(enumerator.deals(37, 150)) + list(enumerator.deals(150))
+        self.assertEqual(parts, whole, "Ranges should join up")
+
+    def test_reduce(self):
+        enumerator = DealEnumerator(self.CARDS, 2, 2)
+        serial = enumerator.reduce(_count_high_first, [0, 0])
+        self.assertEqual(serial, [105, 210], "Either hand is as likely to hold the high card")
+
+        parallel = enumerator.reduce_parallel(_count_high_first, [0, 0], _add_counts, workers=3)
+        self.assertEqual(parallel, serial, "Parallel result should match")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,52 +1,105 @@
 #!/usr/bin/env python3
 
 from Card import Card
-from random import shuffle
+import random
 
 class Deck:
-    """Represent a stack of playing cards, including discards"""
+    """Represent a stack of playing cards, including discards
 
-    def __init__(self, cards:Card=[], refresh:bool=False):
+    Every card of the deck stays in one list, which is only reordered by
+    shuffling, discarding or recycling. Two cursors split it in three:
+
+        [0, top)     the draw pile, with its top card at top - 1
+        [top, out)   cards drawn or dealt, and not yet discarded
+        [out, end)   the discard pile, the latest discard first
+
+    so drawing or dealing just moves the top cursor down, and a deck can
+    always be gathered back together by reset().
+    """
+
+    def __init__(self, cards:Card=[], refresh:bool=False, rng=None):
         """Set up a new deck of cards, parameters are:
 
         cards: an iterator of Card instances
         refresh: Boolean to refill deck when empty
+        rng: a random.Random (or similar) for shuffling, defaults to
+             the random module
         """
 
         try:
             if (len(cards)):
-                self._draw = cards[:] # copy, to be safe
+                self._cards = cards[:] # copy, to be safe
             else:
-                self._draw = []
+                self._cards = []
         except TypeError:
             raise TypeError("Deck needs an iterator of Cards")
 
-        self._discard = []
+        self._top = self._out = len(self._cards)
         self.refresh = refresh
+        self.rng = rng or random
 
 
     def size(self):
-        return len(self._draw)
+        return self._top
+
+
+    def discards(self):
+        """Return the discard pile, in the order the cards were discarded"""
+        discards = self._cards[self._out:]
+        discards.reverse()
+        return(discards)
+
+
+    def _view(self, skip:int, qty:int, step:int=1):
+        """Return up to qty cards from the top of the draw pile downward,
+        skipping the first few and then taking every step-th card"""
+        start = self._top - 1 - skip
+        if start < 0 or qty <= 0:
+            return(self._cards[0:0])
+
+        stop = start - qty * step
+        return(self._cards[start : (stop if stop >= 0 else None) : -1 * step])
 
 
     def peek(self, qty:int=1):
         """Return the topmost card(s) in the deck without removal"""
-        return(self._draw[-1:-1*(qty+1):-1])
+        return(self._view(0, qty))
 
 
     def draw(self, qty:int=1):
         """Return the topmost card(s) in the deck"""
-        if (self.refresh and self.size() == 0):
-            self._draw = self._discard
+        top = self._top
+        if top == 0 and self.refresh:
+            self.recycle(shuffle=False)
+            top = self._top
+
+        # same as peek(qty), inlined since this is the busiest call
+        if qty <= 0:
+            return(self._cards[0:0])
+        if top <= qty:
+            self._top = 0
+            return(self._cards[top - 1 :: -1] if top else self._cards[0:0])
 
-        cards = self.peek(qty)
-        del self._draw[self.size()-qty:]
-        return(cards)
+        self._top = bottom = top - qty
+        return(self._cards[top - 1 : bottom - 1 : -1])
+
+
+    def _drawn(self, card:Card):
+        """Where a drawn card is kept, so it can be discarded"""
+        try:
+            return(self._cards.index(card, self._top, self._out))
+        except ValueError:
+            raise ValueError("Card was not drawn from this deck") from None
 
 
     def discard(self, card:Card):
-        """Discard a single card"""
-        self._discard.push(card)
+        """Discard a single card, one drawn or dealt from this deck"""
+        cards = self._cards
+        drawn = self._drawn(card)
+        out = self._out - 1
+        cards[drawn] = cards[out]
+        cards[out] = card
+        self._out = out
 
 
     def deal(self, players:int, qty:int):
@@ -57,12 +110,20 @@ class Deck:
         Returns list of lists of Cards of equal size, with remaining
         cards left on the deck"""
 
-        dealt = []
+        cards = self._cards
+        top = self._top
+        stop = top - 1 - players * qty
+        if stop < 0:
+            stop = None
+            self._top = 0
+        else:
+            self._top = stop + 1
 
+        dealt = []
         for player in range(players):
-            dealt.append(self._draw[-1 - player :  -1 * (players * qty + 1) : -1 * players])
-
-        del self._draw[(-1*players*qty):]
+            start = top - 1 - player
+            # a short deck runs out before every player gets a card
+            dealt.append(cards[start : stop : -players] if start >= 0 else cards[0:0])
         return(dealt)
 
 
@@ -73,19 +134,53 @@ class Deck:
         dealt = []
 
         if (players != 0):
-            dealt = self.deal(players, self.size() // players)
-
-        if (self.size()):
-            for hand in range(self.size()):
-                dealt[hand].append(self._draw[-1*(hand+1)])
-            self._draw = []
+            # the first (size % players) players get one card extra
+            dealt = [self._view(player, (self.size() - player + players - 1) // players, players)
+                     for player in range(players)]
+            self._top = 0
 
         return(dealt)
 
 
     def shuffle(self):
         """Randomly mix the cards to draw (not discards)"""
-        shuffle(self._draw)
+        if self._top == len(self._cards):
+            self.rng.shuffle(self._cards)
+        else:
+            pile = self._cards[:self._top]
+            self.rng.shuffle(pile)
+            self._cards[:self._top] = pile
+
+
+    def recycle(self, shuffle:bool=True):
+        """Put the discards back under the draw pile, mixing them first.
+
+        Cards still out (drawn and not discarded) stay out. The cards
+        are moved around within the deck's list, not copied to a new one.
+        """
+        cards = self._cards
+        count = len(cards) - self._out
+        if not count:
+            return
+
+        discards = self.discards()
+        if shuffle:
+            self.rng.shuffle(discards)
+
+        top = self._top
+        out = cards[top:self._out]
+        cards[count : count + top] = cards[:top]
+        cards[:count] = discards
+        cards[count + top:] = out
+
+        self._top = top + count
+        self._out = len(cards)
+
+
+    def reset(self):
+        """Gather every card back into the deck, and shuffle it"""
+        self._top = self._out = len(self._cards)
+        self.shuffle()
 
 ###
 
@@ -101,8 +196,8 @@ class TestDeck(unittest.TestCase):
 
         self.assertEqual(deck.refresh, False, "Deck will not refill itself when empty")
         # whitebox
-        self.assertEqual(deck._draw,       cards, "Cards should exist")
-        self.assertEqual(deck._discard,    [],    "Discard container is empty")
+        self.assertEqual(deck._cards,      cards, "Cards should exist")
+        self.assertEqual(deck.discards(),  [],    "Discard container is empty")
 
 
     def test_peek(self):
@@ -134,6 +229,11 @@ class TestDeck(unittest.TestCase):
                          "Remaining last cards in deck should be on top")
         self.assertEqual(deck.size(), len(cards)-1-3, "Wrong number of cards")
 
+        drawn = deck.draw(3)
+        self.assertEqual([p.rank for p in drawn], [1], "Only one card left")
+        self.assertEqual(deck.draw(), [], "No cards left")
+        self.assertEqual(deck.draw(0), [], "No cards asked for")
+
 
     def test_shuffle(self):
         cards = [Card(1), Card(2), Card(3), Card(4), Card(5)]
@@ -149,6 +249,19 @@ class TestDeck(unittest.TestCase):
         self.assertEqual(deck.size(), len(cards), "Wrong number of cards")
 
 
+    def test_shuffle_replay(self):
+        cards = [Card(r) for r in range(1, 14)]
+        first  = Deck(cards, rng=random.Random(42))
+        second = Deck(cards, rng=random.Random(42))
+
+        first.shuffle()
+        second.shuffle()
+
+        self.assertEqual([c.rank for c in first.peek(13)],
+                         [c.rank for c in second.peek(13)],
+                         "Same seed should mix the same way")
+
+
     def test_deal_equal(self):
         cards = [Card(1), Card(2), Card(3), Card(4), Card(5), Card(6)]
         deck  = Deck(cards)
@@ -204,6 +317,19 @@ class TestDeck(unittest.TestCase):
                          "Ranks not correct")
 
 
+    def test_deal_short(self):
+        cards = [Card(1), Card(2), Card(3), Card(4), Card(5)]
+        deck  = Deck(cards)
+        deck.draw(4)
+
+        dealt = deck.deal(players=3, qty=1)
+
+        self.assertEqual([[c.rank for c in hand] for hand in dealt],
+                         [[1], [], []],
+                         "Only the cards left should be dealt")
+        self.assertEqual(deck.size(), 0, "No cards left in deck")
+
+
     def test_deal_all(self):
         cards = [Card(1), Card(2), Card(3), Card(4), Card(5), Card(6), Card(7), Card(8), Card(9), Card(10), Card(11), Card(12), Card(13)]
         deck  = Deck(cards)
@@ -228,6 +354,83 @@ class TestDeck(unittest.TestCase):
                          "Ranks not correct")
 
 
+    def test_recycle(self):
+        cards = [Card(1), Card(2), Card(3), Card(4), Card(5)]
+        deck  = Deck(cards)
+
+        drawn = deck.draw(3)
+        deck.discard(drawn[0])
+        deck.discard(drawn[2])
+
+        deck.recycle()
+        self.assertEqual(deck.size(), 4, "Discards should be back in the deck")
+        self.assertEqual(sorted(c.rank for c in deck.peek(deck.size())),
+                         [1, 2, 3, 5],
+                         "Discards should be under the draw pile")
+        self.assertEqual([c.rank for c in deck.peek(2)],
+                         [2, 1],
+                         "Draw pile order should be kept")
+        # whitebox
+        self.assertEqual(deck.discards(), [], "Discard container is empty")
+        self.assertEqual(len(deck._cards), len(cards), "Storage should be reused")
+
+
+    def test_refresh(self):
+        cards = [Card(1), Card(2), Card(3)]
+        deck  = Deck(cards, refresh=True)
+
+        for card in deck.draw(3):
+            deck.discard(card)
+
+        self.assertEqual(deck.size(), 0, "Cards should be all drawn")
+        self.assertEqual([c.rank for c in deck.draw(3)],
+                         [1, 2, 3],
+                         "Discards should refill the deck in order")
+
+
+    def test_reset(self):
+        cards = [Card(r) for r in range(1, 14)]
+        deck  = Deck(cards)
+
+        deck.deal(players=2, qty=5)
+        deck.discard(deck.draw()[0])
+        deck.reset()
+
+        self.assertEqual(deck.size(), len(cards), "All cards should be back")
+        self.assertEqual(sorted(c.rank for c in deck.peek(13)),
+                         list(range(1, 14)),
+                         "Every card once")
+
+
+    def test_recycle_reset(self):
+        cards = [Card(1), Card(2), Card(3), Card(4), Card(5)]
+        deck  = Deck(cards)
+
+        drawn = deck.draw(3)
+        deck.discard(drawn[0])
+        deck.discard(drawn[2])
+        deck.recycle()
+
+        self.assertEqual(deck.size(), 4, "Discards should be back in the deck")
+        deck.reset()
+        self.assertEqual(deck.size(), len(cards), "All cards should be back")
+        self.assertEqual(sorted(c.rank for c in deck.peek(5)),
+                         [1, 2, 3, 4, 5],
+                         "Every card once, none lost or doubled")
+
+
+    def test_discard(self):
+        cards = [Card(1), Card(2), Card(3)]
+        deck  = Deck(cards)
+
+        drawn = deck.draw(2)
+        deck.discard(drawn[1])
+        self.assertEqual(deck.discards(), [drawn[1]], "Card should be discarded")
+        self.assertRaises(ValueError, deck.discard, drawn[1])
+        self.assertRaises(ValueError, deck.discard, cards[0])
+        self.assertRaises(ValueError, deck.discard, Card(9))
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Time drawing and dealing with the cursor-based Deck and PackedDeck,
+against the previous slice-and-delete Deck
+
+python3 DeckBench.py [repeats]
+"""
+
+import sys
+import time
+
+from Deck import Deck, Card
+from PackedDeck import PackedDeck
+
+class SliceDeck:
+    """The previous Deck: copies the cards out, then deletes them"""
+
+    def __init__(self, cards):
+        self._draw = cards[:]
+
+    def size(self):
+        return len(self._draw)
+
+    def peek(self, qty=1):
+        return(self._draw[-1:-1*(qty+1):-1])
+
+    def draw(self, qty=1):
+        cards = self.peek(qty)
+        del self._draw[self.size()-qty:]
+        return(cards)
+
+    def deal(self, players, qty):
+        dealt = []
+        for player in range(players):
+            dealt.append(self._draw[-1 - player :  -1 * (players * qty + 1) : -1 * players])
+        del self._draw[(-1*players*qty):]
+        return(dealt)
+
+###
+
+CARDS = [Card(r, s) for s in range(1, 5) for r in range(1, 14)]
+
+def draw_all(deck):
+    while deck.size():
+        deck.draw()
+
+def deal_hands(deck):
+    deck.deal(players=4, qty=5)
+
+def timed(deck_class, task, repeats):
+    """Seconds for the task on each of a number of new decks, not
+    counting making the decks"""
+    decks = [deck_class(CARDS) for deck in range(repeats)]
+    start = time.perf_counter()
+    for deck in decks:
+        task(deck)
+    return(time.perf_counter() - start)
+
+def bench(repeats):
+    for name, task, cards in (("draw", draw_all, len(CARDS)), ("deal", deal_hands, 20)):
+        for deck_class in (SliceDeck, Deck, PackedDeck):
+            total = min(timed(deck_class, task, repeats) for attempt in range(5))
+            print("{:5} {:11} {:8.1f} ns/card".format(
+                name, deck_class.__name__, 1e9 * total / (repeats * cards)))
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+from array import array
+import json
+import mmap
+import struct
+import sys
+import zlib
+
+from Deck import Deck, Card
+from PackedDeck import PackedDeck
+
+class DeckSnapshot:
+    """A compact binary copy of a deck's draw and discard piles
+
+    The format is a fixed header, the face table as JSON, and then the
+    packed cards of the draw pile (bottom to top) and the discard pile
+    as unsigned shorts, including each card's hidden/rotation state.
+    Reading a snapshot doesn't copy the cards: draw and discard are
+    memoryviews of the buffer it was read from.
+
+    The face table can be left out (an empty JSON section) when the
+    reader already has it, as in a DeckSnapshotLog.
+    """
+
+    MAGIC = b"DECK"
+    VERSION = 1
+
+    # magic, version, flags, faces, draw count, discard count, JSON length
+    HEADER = struct.Struct("<4sBBHIII")
+
+    FLAG_REFRESH = 0x1
+    FLAG_BIG_ENDIAN = 0x2
+
+    def __init__(self, faces:tuple, draw, discard, refresh:bool=False):
+        self.faces = faces
+        self.draw = draw
+        self.discard = discard
+        self.refresh = refresh
+
+
+    @staticmethod
+    def dumps(deck:Deck, with_faces:bool=True):
+        """Return the snapshot of a Deck or PackedDeck as bytes"""
+        if not isinstance(deck, PackedDeck):
+            # pack the Card objects, then split the piles apart again
+            draw = deck._cards[:deck.size()]
+            packed = PackedDeck(draw + deck.discards(), deck.refresh)
+            draw = packed._cards[:len(draw)]
+            discard = packed._cards[len(draw):]
+        else:
+            packed = deck
+            draw = deck._cards[:deck.size()]
+            discard = deck.discards()
+
+        faces = b""
+        if with_faces:
+            faces = json.dumps(packed._faces, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            faces += b" " * (len(faces) % 2) # keep the cards 2-byte aligned
+
+        flags = DeckSnapshot.FLAG_REFRESH if deck.refresh else 0
+        if sys.byteorder == "big":
+            flags |= DeckSnapshot.FLAG_BIG_ENDIAN
+
+        header = DeckSnapshot.HEADER.pack(DeckSnapshot.MAGIC, DeckSnapshot.VERSION, flags,
+                                          len(packed._faces), len(draw), len(discard), len(faces))
+        return(b"".join((header, faces, draw.tobytes(), discard.tobytes())))
+
+
+    @classmethod
+    def loads(cls, buffer, faces:tuple=None):
+        """Read a snapshot from bytes, a bytearray, an mmap or a memoryview.
+        If the snapshot was written without its face table, pass it in."""
+        view = memoryview(buffer)
+        header = DeckSnapshot.HEADER.size
+        if len(view) < header:
+            raise ValueError("Snapshot is too short")
+
+        magic, version, flags, face_count, draw_count, discard_count, faces_length = \
+            DeckSnapshot.HEADER.unpack(view[:header])
+        if magic != DeckSnapshot.MAGIC or version != DeckSnapshot.VERSION:
+            raise ValueError("Not a deck snapshot")
+
+        start = header + faces_length
+        middle = start + 2 * draw_count
+        end = middle + 2 * discard_count
+        if len(view) < end:
+            raise ValueError("Snapshot is too short")
+        if len(view) > end:
+            raise ValueError("Snapshot has data after its cards")
+
+        if faces_length:
+            faces = tuple(tuple(face) for face in json.loads(bytes(view[header:start]).decode("utf-8")))
+        if faces is None or len(faces) != face_count:
+            raise ValueError("Snapshot face table is damaged")
+
+        draw = view[start:middle].cast("H")
+        discard = view[middle:end].cast("H")
+
+        if bool(flags & DeckSnapshot.FLAG_BIG_ENDIAN) != (sys.byteorder == "big"):
+            # written on the other kind of machine: has to be copied
+            draw = array("H", draw)
+            draw.byteswap()
+            discard = array("H", discard)
+            discard.byteswap()
+
+        return(cls(faces, draw, discard, bool(flags & DeckSnapshot.FLAG_REFRESH)))
+
+
+    def deck(self, rng=None):
+        """Make a PackedDeck with the snapshot's piles"""
+        deck = PackedDeck.from_faces(self.faces, self.refresh, rng)
+        # the discard pile is kept latest first, above the draw pile
+        discard = array("H", self.discard)
+        discard.reverse()
+        deck._cards = array("H", self.draw) + discard
+        deck._top = deck._out = len(self.draw)
+        return(deck)
+
+
+class DeckSnapshotLog:
+    """Append deck snapshots to a file, to checkpoint long simulations
+
+    Each record is the snapshot's length and checksum, then the
+    snapshot. The face table is only written when it changes (and at
+    the start of each time the log is opened), so each snapshot after the
+    first is little more than its cards. A record cut short or damaged by
+    a crash is ignored when reading, along with everything after it, and
+    cut off when the log is next opened, so new records aren't lost
+    behind it.
+    """
+
+    RECORD = struct.Struct("<II") # length, CRC-32 of the snapshot after it
+
+    def __init__(self, file_name:str):
+        self.file_name = file_name
+        self._file = open(file_name, "ab")
+        end = DeckSnapshotLog._end(file_name)
+        if end < self._file.tell():
+            self._file.truncate(end)
+            self._file.seek(end)
+        self._faces = None
+
+    def append(self, deck:Deck):
+        """Write a snapshot of the deck to the end of the log"""
+        faces = deck._faces if isinstance(deck, PackedDeck) else None
+        snapshot = DeckSnapshot.dumps(deck, faces is None or faces is not self._faces)
+        self._faces = faces
+        self._file.write(DeckSnapshotLog.RECORD.pack(len(snapshot), zlib.crc32(snapshot) & 0xffffffff))
+        self._file.write(snapshot)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    @staticmethod
+    def _records(file_name:str):
+        """Yield a memoryview of each whole record's snapshot, and the
+        offset just after it, from the memory-mapped file"""
+        with open(file_name, "rb") as log_file:
+            try:
+                mapped = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return # empty file
+
+        view = memoryview(mapped)
+        header = DeckSnapshotLog.RECORD.size
+        offset = 0
+        try:
+            while offset + header <= len(view):
+                size, checksum = DeckSnapshotLog.RECORD.unpack(view[offset:offset + header])
+                start = offset + header
+                snapshot = view[start:start + size]
+                if len(snapshot) < size or zlib.crc32(snapshot) & 0xffffffff != checksum:
+                    snapshot.release()
+                    break
+                offset = start + size
+                try:
+                    yield(snapshot, offset)
+                finally:
+                    snapshot.release()
+        finally:
+            view.release()
+            mapped.close()
+
+    @staticmethod
+    def _end(file_name:str):
+        """The offset just after the last whole record"""
+        end = 0
+        for snapshot, end in DeckSnapshotLog._records(file_name):
+            pass
+        return(end)
+
+    @staticmethod
+    def read(file_name:str):
+        """Yield each snapshot in a log, read from the memory-mapped file.
+        Each one's cards are copied out of the map, so snapshots can be
+        kept, and the generator left, at any point."""
+        faces = None
+        records = DeckSnapshotLog._records(file_name)
+        try:
+            for data, end in records:
+                snapshot = DeckSnapshot.loads(bytes(data), faces)
+                faces = snapshot.faces
+                yield(snapshot)
+        finally:
+            records.close()
+
+###
+
+import os
+import pickle
+import tempfile
+import unittest
+
+class TestDeckSnapshot(unittest.TestCase):
+
+    def test_packed(self):
+        from RegularDeck import RegularDeck
+
+        deck = RegularDeck.packed(refresh=True)
+        drawn = deck.draw(3)
+        deck.discard(PackedDeck.shown(drawn[0]))
+
+        data = DeckSnapshot.dumps(deck)
+        self.assertLess(len(data), len(pickle.dumps(RegularDeck()._cards)), "Snapshot should be compact")
+        self.assertEqual(len(DeckSnapshot.dumps(deck, with_faces=False)),
+                         DeckSnapshot.HEADER.size + 2 * 50,
+                         "Without faces, just the cards")
+
+        snapshot = DeckSnapshot.loads(data)
+        self.assertIsInstance(snapshot.draw, memoryview, "Cards should not be copied")
+        self.assertEqual(list(snapshot.draw), list(deck._cards[:49]), "Draw pile should match")
+        self.assertEqual(list(snapshot.discard), list(deck.discards()), "Discard pile should match")
+        self.assertTrue(snapshot.refresh, "Refresh should match")
+
+        restored = snapshot.deck()
+        self.assertEqual(restored.size(), 49, "Wrong number of cards")
+        self.assertEqual(list(restored.peek(5)), list(deck.peek(5)), "Top cards should match")
+        self.assertFalse(restored.card(restored.discards()[0]).is_hidden(), "Card state should be kept")
+
+
+    def test_cards(self):
+        cards = [Card(1, 2, 3, "I", "B"), Card(2), Card(3)]
+        cards[0].show()
+        cards[1].rotate(2)
+
+        deck = Deck(cards)
+        deck.discard(deck.draw()[0])
+
+        restored = DeckSnapshot.loads(DeckSnapshot.dumps(deck)).deck()
+        made = restored.cards(restored.peek(2))
+        self.assertEqual([c.rank for c in made], [2, 1], "Ranks not correct")
+        self.assertEqual(made[0]._rotation, 2, "Rotation should be kept")
+        self.assertFalse(made[1].is_hidden(), "Shown state should be kept")
+        self.assertEqual([c.rank for c in restored.cards(restored.discards())], [3], "Discards not correct")
+
+
+    def test_bad_data(self):
+        self.assertRaises(ValueError, DeckSnapshot.loads, b"DECK")
+        self.assertRaises(ValueError, DeckSnapshot.loads, b"X" * 64)
+
+        data = DeckSnapshot.dumps(PackedDeck([Card(1), Card(2)]))
+        self.assertRaises(ValueError, DeckSnapshot.loads, data[:-1])
+        self.assertRaises(ValueError, DeckSnapshot.loads, data + b"\0\0")
+
+
+    def test_log(self):
+        file_name = os.path.join(tempfile.mkdtemp(), "decks.log")
+        deck = PackedDeck([Card(r) for r in range(1, 11)])
+
+        with DeckSnapshotLog(file_name) as log:
+            for turn in range(3):
+                deck.draw()
+                log.append(deck)
+
+        with open(file_name, "ab") as log_file:
+            log_file.write(b"\xff\x00") # a record cut short
+
+        sizes = [snapshot.deck().size() for snapshot in DeckSnapshotLog.read(file_name)]
+        self.assertEqual(sizes, [9, 8, 7], "Every complete snapshot should be read")
+
+        first = len(DeckSnapshot.dumps(deck))
+        self.assertLess(os.path.getsize(file_name), 3 * first, "Faces should be written once")
+
+
+    def test_log_torn(self):
+        file_name = os.path.join(tempfile.mkdtemp(), "decks.log")
+        deck = PackedDeck([Card(r) for r in range(1, 11)])
+
+        with DeckSnapshotLog(file_name) as log:
+            for turn in range(2):
+                deck.draw()
+                log.append(deck)
+
+        # * A crash part way through writing the second record
+
+        with open(file_name, "r+b") as log_file:
+            log_file.truncate(os.path.getsize(file_name) - 5)
+
+        # * The next run's records are not read as part of the torn one
+
+        with DeckSnapshotLog(file_name) as log:
+            for turn in range(3):
+                deck.draw()
+                log.append(deck)
+
+        sizes = [snapshot.deck().size() for snapshot in DeckSnapshotLog.read(file_name)]
+        self.assertEqual(sizes, [9, 7, 6, 5], "Torn record should be cut off, new ones kept")
+
+        # * A damaged record and everything after it are dropped
+
+        with open(file_name, "r+b") as log_file:
+            log_file.seek(os.path.getsize(file_name) - 1)
+            log_file.write(b"\xff")
+
+        sizes = [snapshot.deck().size() for snapshot in DeckSnapshotLog.read(file_name)]
+        self.assertEqual(sizes, [9, 7, 6], "Bad checksum should stop the read")
+
+
+    def test_log_early_exit(self):
+        file_name = os.path.join(tempfile.mkdtemp(), "decks.log")
+        deck = PackedDeck([Card(r) for r in range(1, 11)])
+
+        with DeckSnapshotLog(file_name) as log:
+            for turn in range(3):
+                deck.draw()
+                log.append(deck)
+
+        snapshots = DeckSnapshotLog.read(file_name)
+        for snapshot in snapshots:
+            break
+        snapshots.close() # closes the map, with the snapshot still held
+
+        self.assertEqual(snapshot.deck().size(), 9, "Snapshot should outlive the log")
+        self.assertEqual(list(snapshot.draw), list(deck._cards[:9]), "Cards should be kept")
+
+        kept = list(DeckSnapshotLog.read(file_name))
+        self.assertEqual([s.deck().size() for s in kept], [9, 8, 7], "Snapshots can all be kept")
+
+
+if __name__ == '__main__':
+    unittest.main()
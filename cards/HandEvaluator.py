@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+from array import array
+from itertools import combinations, combinations_with_replacement
+import os
+import pickle
+
+from RegularDeck import RegularDeck, Card
+
+class HandEvaluator:
+    """Score poker hands of 5 to 7 cards from a RegularDeck
+
+    Cards are numbered 0-51 in the order of RegularDeck.faces(), that is
+    (suit - 1) * 13 + (rank - 1). A score is 1 (the worst high-card
+    hand) to 7462 (a royal flush), so higher scores win and equal
+    scores tie, whatever the number of cards.
+
+    Scores come from two tables that are built once and cached on disk:
+    one indexed by the bitmask of ranks in a flush, and one keyed by the
+    product of a prime per rank, which is unique to each mix of ranks.
+    """
+
+    CATEGORY_HIGH_CARD       = 0
+    CATEGORY_PAIR            = 1
+    CATEGORY_TWO_PAIR        = 2
+    CATEGORY_THREE_OF_A_KIND = 3
+    CATEGORY_STRAIGHT        = 4
+    CATEGORY_FLUSH           = 5
+    CATEGORY_FULL_HOUSE      = 6
+    CATEGORY_FOUR_OF_A_KIND  = 7
+    CATEGORY_STRAIGHT_FLUSH  = 8
+
+    # Lowest score of each category, in category order
+    CATEGORY_LOWEST = (1, 1278, 4138, 4996, 5854, 5864, 7141, 7297, 7453)
+
+    # Rank slots 0-12 run from two up to ace, for ordering
+    PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+    CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "HandEvaluator.cache")
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_file:str=CACHE_FILE):
+        """Load the scoring tables, building and caching them if needed.
+        Pass cache_file=None to build them without touching the disk."""
+
+        tables = None
+        if cache_file:
+            try:
+                with open(cache_file, "rb") as data_file:
+                    version, flushes, products = pickle.load(data_file)
+                if version == HandEvaluator.CACHE_VERSION:
+                    tables = (array("H", flushes), products)
+            except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+                pass
+
+        if tables is None:
+            tables = HandEvaluator.build_tables()
+            if cache_file:
+                try:
+                    with open(cache_file, "wb") as data_file:
+                        pickle.dump((HandEvaluator.CACHE_VERSION, tables[0].tobytes(), tables[1]),
+                                    data_file, pickle.HIGHEST_PROTOCOL)
+                except IOError:
+                    pass # not fatal, the tables are built again next time
+
+        self._flushes, self._products = tables
+
+        # Per-card lookups, by card number: aces move to the top slot
+        slots = [(n % 13 - 1) % 13 for n in range(52)]
+        self._prime = tuple(HandEvaluator.PRIMES[slot] for slot in slots)
+        self._bit   = tuple(1 << slot for slot in slots)
+        self._suit  = tuple(n // 13 for n in range(52))
+
+
+    @staticmethod
+    def card_number(card:Card):
+        """Number a RegularDeck card for scoring"""
+        return((card.suit - RegularDeck.SUIT_SPADE) * 13 + card.rank - RegularDeck.RANK_ACE)
+
+
+    def score(self, hand):
+        """Score a hand of 5-7 card numbers"""
+        product = 1
+        masks = [0, 0, 0, 0]
+        counts = [0, 0, 0, 0]
+        for card in hand:
+            product *= self._prime[card]
+            suit = self._suit[card]
+            masks[suit] |= self._bit[card]
+            counts[suit] += 1
+
+        # With at most 7 cards, five of one suit can't also hold a full
+        # house or four of a kind, so a flush always scores from its suit
+        for suit in range(4):
+            if counts[suit] >= 5:
+                return(self._flushes[masks[suit]])
+
+        return(self._products[product])
+
+
+    def score_many(self, hands):
+        """Score a batch of hands, returning an array of scores"""
+        prime = self._prime
+        bit = self._bit
+        suit_of = self._suit
+        flushes = self._flushes
+        products = self._products
+
+        scores = array("H")
+        for hand in hands:
+            product = 1
+            masks = [0, 0, 0, 0]
+            counts = [0, 0, 0, 0]
+            for card in hand:
+                product *= prime[card]
+                suit = suit_of[card]
+                masks[suit] |= bit[card]
+                counts[suit] += 1
+
+            for suit in range(4):
+                if counts[suit] >= 5:
+                    scores.append(flushes[masks[suit]])
+                    break
+            else:
+                scores.append(products[product])
+
+        return(scores)
+
+
+    @staticmethod
+    def category(score:int):
+        """Return the CATEGORY_ value for a score"""
+        for category, lowest in reversed(list(enumerate(HandEvaluator.CATEGORY_LOWEST))):
+            if score >= lowest:
+                return(category)
+
+    ###
+    # Building the tables
+
+    @staticmethod
+    def _rank_key(slots, flush:bool):
+        """Sortable (category, tie-breakers) key for five rank slots"""
+        counts = {}
+        for slot in slots:
+            counts[slot] = counts.get(slot, 0) + 1
+
+        # Most repeated first, then highest
+        order = sorted(counts, key=lambda s: (counts[s], s), reverse=True)
+        shape = sorted(counts.values(), reverse=True)
+
+        straight = None
+        if len(counts) == 5:
+            if order[0] - order[4] == 4:
+                straight = order[0]
+            elif order == [12, 3, 2, 1, 0]:
+                straight = 3 # ace-low, five high
+
+        if straight is not None:
+            category = HandEvaluator.CATEGORY_STRAIGHT_FLUSH if flush else HandEvaluator.CATEGORY_STRAIGHT
+            return((category, straight))
+        if flush:
+            return((HandEvaluator.CATEGORY_FLUSH,) + tuple(order))
+
+        category = {(4, 1):          HandEvaluator.CATEGORY_FOUR_OF_A_KIND,
+                    (3, 2):          HandEvaluator.CATEGORY_FULL_HOUSE,
+                    (3, 1, 1):       HandEvaluator.CATEGORY_THREE_OF_A_KIND,
+                    (2, 2, 1):       HandEvaluator.CATEGORY_TWO_PAIR,
+                    (2, 1, 1, 1):    HandEvaluator.CATEGORY_PAIR,
+                    (1, 1, 1, 1, 1): HandEvaluator.CATEGORY_HIGH_CARD}[tuple(shape)]
+        return((category,) + tuple(order))
+
+
+    @staticmethod
+    def build_tables():
+        """Build the flush and prime-product tables from scratch"""
+
+        # Every distinct five-card hand, ranked from worst to best
+
+        keys = set()
+        for slots in combinations_with_replacement(range(13), 5):
+            if max(slots.count(s) for s in slots) <= 4:
+                keys.add(HandEvaluator._rank_key(slots, False))
+        for slots in combinations(range(13), 5):
+            keys.add(HandEvaluator._rank_key(slots, True))
+
+        scores = {key: n + 1 for n, key in enumerate(sorted(keys))}
+
+        # Flushes: best five of the ranks in one suit
+
+        flushes = array("H", [0]) * (1 << 13)
+        best_five = {}
+        for slots in combinations(range(13), 5):
+            mask = sum(1 << s for s in slots)
+            best_five[mask] = scores[HandEvaluator._rank_key(slots, True)]
+        for size in (5, 6, 7):
+            for slots in combinations(range(13), size):
+                mask = sum(1 << s for s in slots)
+                flushes[mask] = max(best_five[sum(1 << s for s in five)]
+                                    for five in combinations(slots, 5))
+
+        # Everything else: best five of the ranks, by prime product
+
+        products = {}
+        five_scores = {}
+        for size in (5, 6, 7):
+            for slots in combinations_with_replacement(range(13), size):
+                if max(slots.count(s) for s in slots) > 4:
+                    continue
+                product = 1
+                for s in slots:
+                    product *= HandEvaluator.PRIMES[s]
+                if size == 5:
+                    five_scores[product] = scores[HandEvaluator._rank_key(slots, False)]
+                    products[product] = five_scores[product]
+                else:
+                    best = 0
+                    for five in set(combinations(slots, 5)):
+                        part = 1
+                        for s in five:
+                            part *= HandEvaluator.PRIMES[s]
+                        best = max(best, five_scores[part])
+                    products[product] = best
+
+        return(flushes, products)
+
+###
+
+import unittest
+
+class TestHandEvaluator(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.evaluator = HandEvaluator(cache_file=None)
+
+    def hand(self, *names):
+        """Card numbers from names like "AS", "TD", "9H" """
+        ranks = "A23456789TJQK"
+        suits = "SHCD"
+        return([suits.index(n[1]) * 13 + ranks.index(n[0]) for n in names])
+
+    def test_card_number(self):
+        for n, face in enumerate(RegularDeck.faces()):
+            self.assertEqual(HandEvaluator.card_number(Card(*face)), n, "Numbers follow RegularDeck.faces()")
+
+    def test_categories(self):
+        hands = [(HandEvaluator.CATEGORY_HIGH_CARD,       ("2S", "4H", "6C", "8D", "TS")),
+                 (HandEvaluator.CATEGORY_PAIR,            ("2S", "2H", "6C", "8D", "TS")),
+                 (HandEvaluator.CATEGORY_TWO_PAIR,        ("2S", "2H", "6C", "6D", "TS")),
+                 (HandEvaluator.CATEGORY_THREE_OF_A_KIND, ("2S", "2H", "2C", "8D", "TS")),
+                 (HandEvaluator.CATEGORY_STRAIGHT,        ("AS", "2H", "3C", "4D", "5S")),
+                 (HandEvaluator.CATEGORY_FLUSH,           ("2S", "4S", "6S", "8S", "TS")),
+                 (HandEvaluator.CATEGORY_FULL_HOUSE,      ("2S", "2H", "2C", "8D", "8S")),
+                 (HandEvaluator.CATEGORY_FOUR_OF_A_KIND,  ("2S", "2H", "2C", "2D", "TS")),
+                 (HandEvaluator.CATEGORY_STRAIGHT_FLUSH,  ("TS", "JS", "QS", "KS", "AS"))]
+
+        scores = []
+        for category, names in hands:
+            score = self.evaluator.score(self.hand(*names))
+            self.assertEqual(HandEvaluator.category(score), category, "Wrong category for %s" % (names,))
+            scores.append(score)
+
+        self.assertEqual(scores, sorted(scores), "Categories should rank in order")
+        self.assertEqual(scores[-1], 7462, "Royal flush is the best hand")
+
+    def test_ties_and_kickers(self):
+        score = self.evaluator.score
+        self.assertEqual(score(self.hand("AS", "KS", "9H", "9C", "2D")),
+                         score(self.hand("AH", "KD", "9S", "9D", "2C")),
+                         "Same ranks in other suits should tie")
+        self.assertGreater(score(self.hand("AS", "KS", "9H", "9C", "3D")),
+                           score(self.hand("AH", "KD", "9S", "9D", "2C")),
+                           "Kicker should count")
+        self.assertGreater(score(self.hand("2S", "3H", "4C", "5D", "6S")),
+                           score(self.hand("AS", "2H", "3C", "4D", "5S")),
+                           "Ace-low straight is the lowest straight")
+
+    def test_seven_cards(self):
+        score = self.evaluator.score
+        self.assertEqual(score(self.hand("AS", "KS", "QS", "JS", "TS", "2H", "3D")), 7462,
+                         "Best five of seven")
+        self.assertEqual(score(self.hand("9S", "9H", "9C", "4D", "4S", "4H", "2D")),
+                         score(self.hand("9S", "9H", "9C", "4D", "4S")),
+                         "Two triples make the best full house")
+        self.assertEqual(HandEvaluator.category(score(self.hand("2S", "5S", "7S", "9S", "JS", "JH", "JD"))),
+                         HandEvaluator.CATEGORY_FLUSH,
+                         "Flush beats three of a kind")
+
+    def test_score_many(self):
+        hands = [self.hand("2S", "4H", "6C", "8D", "TS"),
+                 self.hand("AS", "KS", "QS", "JS", "TS", "2H", "3D"),
+                 self.hand("2S", "2H", "6C", "6D", "TS", "TH")]
+        self.assertEqual(list(self.evaluator.score_many(hands)),
+                         [self.evaluator.score(h) for h in hands],
+                         "Batch scores should match single scores")
+
+    def test_cache(self):
+        import tempfile
+        cache_file = os.path.join(tempfile.mkdtemp(), "hands.cache")
+
+        built  = HandEvaluator(cache_file)
+        cached = HandEvaluator(cache_file)
+        self.assertTrue(os.path.exists(cache_file), "Tables should be cached")
+        self.assertEqual(cached._flushes, built._flushes, "Cached flushes should match")
+        self.assertEqual(cached._products, built._products, "Cached products should match")
+
+if __name__ == '__main__':
+    unittest.main()
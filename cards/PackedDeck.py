@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+from array import array
+import random
+
+from Deck import Deck, Card
+
+class PackedDeck(Deck):
+    """Represent a stack of playing cards packed into small integers
+
+    Each card is stored as one unsigned short in an array: the low bits
+    index a table of card faces (rank, suit, color, icon, back), and the
+    high bits carry the card's state (hidden, rotation). Drawing,
+    dealing, peeking and shuffling all work on the packed values, and
+    Card objects are only made when asked for with card() or cards().
+
+    Cards handed out by peek, draw and deal are small arrays of packed
+    values, copied out of the deck's own array: discarding moves cards
+    around inside it, so views of it would not stay put.
+    """
+
+    FACE_BITS      = 13
+    FACE_MASK      = (1 << FACE_BITS) - 1
+    ROTATION_SHIFT = FACE_BITS
+    ROTATION_MASK  = 0x3 << ROTATION_SHIFT
+    HIDDEN         = 1 << 15
+
+
+    def __init__(self, cards:Card=[], refresh:bool=False, rng=None):
+        """Set up a new packed deck of cards, parameters are:
+
+        cards: an iterator of Card instances
+        refresh: Boolean to refill deck when empty
+        rng: a random.Random (or similar) for shuffling
+
+        Cards sharing the same face are stored once in the face table.
+        """
+
+        self._faces = []
+        faces = {}
+        self._cards = array("H")
+
+        try:
+            for card in cards:
+                face = (card.rank, card.suit, card.color, card.icon, card.back)
+                if face not in faces:
+                    if len(self._faces) > PackedDeck.FACE_MASK:
+                        raise ValueError("Too many distinct cards to pack")
+                    faces[face] = len(self._faces)
+                    self._faces.append(face)
+                self._cards.append(PackedDeck.pack(faces[face],
+                                                  card.is_hidden(),
+                                                  card._rotation))
+        except (TypeError, AttributeError):
+            raise TypeError("Deck needs an iterator of Cards")
+
+        self._faces = tuple(self._faces)
+        self._top = self._out = len(self._cards)
+        self.refresh = refresh
+        self.rng = rng or random
+
+
+    @classmethod
+    def from_faces(cls, faces:tuple, refresh:bool=False, rng=None):
+        """Make a deck with one hidden card for each face in a table of
+        (rank, suit, color, icon, back) tuples. The table is shared, not
+        copied, so any number of decks can use the same one."""
+        if len(faces) > PackedDeck.FACE_MASK + 1:
+            raise ValueError("Too many distinct cards to pack")
+
+        deck = cls(refresh=refresh, rng=rng)
+        deck._faces = faces
+        deck._cards.extend(face | PackedDeck.HIDDEN for face in range(len(faces)))
+        deck._top = deck._out = len(deck._cards)
+        return(deck)
+
+
+    @staticmethod
+    def pack(face:int, hidden:bool=True, rotation:int=None):
+        """Encode a face index and card state as a single integer.
+
+        Rotation is limited to the suggested values 0-3, with None
+        stored as 0.
+        """
+        rotation = rotation or 0
+        if not 0 <= rotation <= 3:
+            raise ValueError("Packed cards only support rotations 0-3")
+        return(face | (rotation << PackedDeck.ROTATION_SHIFT) | (PackedDeck.HIDDEN if hidden else 0))
+
+    @staticmethod
+    def face(code:int):
+        return(code & PackedDeck.FACE_MASK)
+
+    @staticmethod
+    def is_hidden(code:int):
+        return(bool(code & PackedDeck.HIDDEN))
+
+    @staticmethod
+    def rotation(code:int):
+        return((code & PackedDeck.ROTATION_MASK) >> PackedDeck.ROTATION_SHIFT)
+
+    @staticmethod
+    def is_rotated(code:int):
+        return(bool(code & PackedDeck.ROTATION_MASK))
+
+    @staticmethod
+    def shown(code:int):
+        """Return the code for the front of the card"""
+        return(code & ~PackedDeck.HIDDEN)
+
+    @staticmethod
+    def hidden(code:int):
+        """Return the code for the back of the card"""
+        return(code | PackedDeck.HIDDEN)
+
+    @staticmethod
+    def rotated(code:int, rotation:int):
+        """Return the code with the card's rotation replaced"""
+        return(PackedDeck.pack(PackedDeck.face(code), PackedDeck.is_hidden(code), rotation))
+
+
+    def rank(self, code:int):
+        return(self._faces[PackedDeck.face(code)][0])
+
+    def suit(self, code:int):
+        return(self._faces[PackedDeck.face(code)][1])
+
+
+    def card(self, code:int):
+        """Make a Card object for a packed card, including its state"""
+        card = Card(*self._faces[PackedDeck.face(code)])
+        if not PackedDeck.is_hidden(code):
+            card.show()
+        if PackedDeck.is_rotated(code):
+            card.rotate(PackedDeck.rotation(code))
+        return(card)
+
+    def cards(self, codes):
+        """Make a list of Card objects for an iterator of packed cards"""
+        return([self.card(code) for code in codes])
+
+
+    def _drawn(self, code:int):
+        """Where a drawn card with the same face is kept: its state may
+        have changed since it was drawn"""
+        face = code & PackedDeck.FACE_MASK
+        cards = self._cards
+        for drawn in range(self._top, self._out):
+            if cards[drawn] & PackedDeck.FACE_MASK == face:
+                return(drawn)
+        raise ValueError("Card was not drawn from this deck")
+
+    def discard(self, code:int):
+        """Discard a single packed card, one drawn or dealt from this deck"""
+        Deck.discard(self, code)
+
+###
+
+import unittest
+
+class TestPackedDeck(unittest.TestCase):
+
+    def test_create(self):
+        cards = [Card(1), Card(2), Card(3), Card(4), Card(5)]
+        deck  = PackedDeck(cards)
+
+        self.assertEqual(deck.size(), len(cards), "Wrong number of cards")
+        self.assertEqual(deck.refresh, False, "Deck will not refill itself when empty")
+        # whitebox
+        self.assertEqual(deck._cards.typecode, "H", "Cards should be packed")
+        self.assertEqual(len(deck._faces), len(cards), "One face per distinct card")
+        self.assertEqual(len(deck.discards()), 0, "Discard container is empty")
+
+        self.assertRaises(TypeError, PackedDeck, 5)
+        self.assertRaises(TypeError, PackedDeck, [1, 2, 3])
+
+
+    def test_shared_faces(self):
+        cards = [Card(1, 1), Card(1, 1), Card(2, 1)]
+        deck  = PackedDeck(cards)
+
+        self.assertEqual(deck.size(), 3, "Wrong number of cards")
+        # whitebox
+        self.assertEqual(len(deck._faces), 2, "Duplicate cards share a face")
+
+
+    def test_state(self):
+        card = Card(7, 2, 1, "I", "B")
+        card.show()
+        card.rotate(1)
+
+        deck = PackedDeck([card, Card(8)])
+        code = deck.peek(2)[1]
+
+        self.assertFalse(PackedDeck.is_hidden(code), "Shown state should be packed")
+        self.assertEqual(PackedDeck.rotation(code), 1, "Rotation should be packed")
+        self.assertEqual(deck.rank(code), 7, "Rank does not match")
+        self.assertEqual(deck.suit(code), 2, "Suit does not match")
+
+        code = PackedDeck.rotated(PackedDeck.hidden(code), 0)
+        self.assertTrue(PackedDeck.is_hidden(code), "Should be hidden again")
+        self.assertFalse(PackedDeck.is_rotated(code), "Rotation should have been cleared")
+
+        self.assertRaises(ValueError, PackedDeck.rotated, code, 5)
+
+
+    def test_card(self):
+        card = Card(3, 4, 5, "I", "B")
+        card.show()
+        deck = PackedDeck([card])
+
+        made = deck.card(deck.peek()[0])
+        self.assertEqual((made.rank, made.suit, made.color, made.icon, made.back),
+                         (3, 4, 5, "I", "B"),
+                         "Face does not match")
+        self.assertFalse(made.is_hidden(), "Should be shown")
+        self.assertFalse(made.is_rotated(), "Should not be rotated")
+        self.assertIsNot(made, card, "Cards are made on demand")
+
+
+    def test_draw(self):
+        cards = [Card(1), Card(2), Card(3), Card(4), Card(5)]
+        deck  = PackedDeck(cards)
+
+        drawn = deck.draw()
+        self.assertEqual(deck.rank(drawn[0]), 5, "Last card in deck should be on top")
+
+        drawn = deck.draw(3)
+        self.assertEqual([c.rank for c in deck.cards(drawn)],
+                         [4, 3, 2],
+                         "Remaining last cards in deck should be on top")
+        self.assertEqual(deck.size(), 1, "Wrong number of cards")
+
+
+    def test_shuffle(self):
+        cards = [Card(r) for r in range(1, 14)]
+        deck  = PackedDeck(cards)
+
+        peeked = list(deck.peek(13))
+        deck.shuffle()
+        shuffled = list(deck.peek(13))
+
+        self.assertNotEqual(peeked, shuffled, "Cards should have been mixed")
+        self.assertEqual(sorted(peeked), sorted(shuffled), "Same cards after mixing")
+        # whitebox
+        self.assertEqual(deck._cards.typecode, "H", "Cards should still be packed")
+
+
+    def test_deal_all(self):
+        cards = [Card(r) for r in range(1, 14)]
+        deck  = PackedDeck(cards)
+
+        dealt = deck.deal_all(players=3)
+
+        self.assertEqual(deck.size(), 0, "Cards should be all dealt")
+        self.assertEqual([deck.rank(c) for c in dealt[0]],
+                         [13, 10, 7, 4, 1],
+                         "Ranks not correct")
+        self.assertEqual([deck.rank(c) for c in dealt[2]],
+                         [11, 8, 5, 2],
+                         "Ranks not correct")
+
+
+    def test_deal_short(self):
+        deck = PackedDeck([Card(r) for r in range(1, 6)])
+        deck.draw(4)
+
+        dealt = deck.deal(players=3, qty=1)
+
+        self.assertEqual([[deck.rank(c) for c in hand] for hand in dealt],
+                         [[1], [], []],
+                         "Only the cards left should be dealt")
+
+
+    def test_refresh(self):
+        deck = PackedDeck([Card(1), Card(2)], refresh=True)
+
+        for code in deck.draw(2):
+            deck.discard(code)
+
+        self.assertEqual(deck.size(), 0, "Cards should be all drawn")
+        self.assertEqual(len(deck.draw()), 1, "Discards should refill the deck")
+
+
+    def test_discard_state(self):
+        deck = PackedDeck([Card(1), Card(2), Card(3)])
+
+        drawn = list(deck.draw(2))
+        deck.discard(PackedDeck.shown(drawn[1]))
+        self.assertEqual([PackedDeck.is_hidden(c) for c in deck.discards()], [False],
+                         "Discard should keep the card's new state")
+        self.assertRaises(ValueError, deck.discard, drawn[1])
+
+        deck.reset()
+        self.assertEqual(sorted(deck.rank(c) for c in deck.peek(3)), [1, 2, 3],
+                         "Every card once")
+
+
+if __name__ == '__main__':
+    unittest.main()
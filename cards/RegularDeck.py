@@ -1,21 +1,48 @@
 #!/usr/bin/env python3
 
+import sys
+import warnings
+
 from Deck import Deck, Card
+from PackedDeck import PackedDeck
+
+def _face(rank:int, suit:int):
+    """Face data for a regular card: (rank, suit, color, icon, back)"""
+
+    # Unicode defines a "Knight" card between Jack and Queen, so Queens
+    # and Kings are one further along than their rank suggests
+    offset = rank - 1 if rank < 12 else rank
+    icon = chr(ord("\N{PLAYING CARD ACE OF SPADES}") + (suit - 1) * 16 + offset)
+
+    return((rank, suit, (suit - 1) % 2, sys.intern(icon), "\N{PLAYING CARD BACK}"))
+
+class _Deprecated:
+    """A class attribute that is made afresh each time it's used, with
+    a warning to use something else"""
+
+    def __init__(self, make, message:str):
+        self.make = make
+        self.message = message
+
+    def __get__(self, instance, owner):
+        warnings.warn(self.message, DeprecationWarning, stacklevel=2)
+        return(self.make(owner))
 
 class RegularDeck(Deck):
+    """The 52 cards of a regular deck, in four suits
 
-    CARDS = [Card(rank=r+1,
-                  suit=s+1,
-                  color=(s % 2),
-                  icon=chr(ord("\N{PLAYING CARD ACE OF SPADES}")+s*16+r))
-             for s in range(4) for r in range(13)]
+    The face of each card lives in one shared, read-only table: see
+    faces(). Each RegularDeck makes its own Card objects from it, so
+    showing or rotating a card in one deck can't affect another, and
+    packed() makes a PackedDeck that shares the table directly.
+    """
 
-    # Unicode defines a "Knight" card between Jack and Queen, so Queens and Kings
-    # have the wrong icon by the above generator. Adjusting:
+    # Every card, as new Card objects each time. Use faces() for the
+    # card data, or deal from a RegularDeck.
+    CARDS = _Deprecated(lambda cls: [Card(*face) for face in cls.faces()],
+                        "RegularDeck.CARDS is deprecated, use RegularDeck.faces()")
 
-    for s in range(4):
-        CARDS[11+13*s].icon = chr(ord("\N{PLAYING CARD QUEEN OF SPADES}")+s*16)
-        CARDS[12+13*s].icon = chr(ord("\N{PLAYING CARD KING OF SPADES}")+s*16)
+    _FACES = None
 
     RANK_ACE   = 1
     RANK_TWO   = 2
@@ -36,27 +63,106 @@ class RegularDeck(Deck):
     SUIT_CLUB    = 3
     SUIT_DIAMOND = 4
 
+
+    def __init__(self, cards:Card=None, refresh:bool=False, *, rng=None):
+        """Set up a deck of the given cards, or by default a full deck of
+        new cards, face-down"""
+        if cards is None:
+            cards = [Card(*face) for face in RegularDeck.faces()]
+        Deck.__init__(self, cards, refresh, rng)
+
+
+    @classmethod
+    def faces(cls):
+        """The shared table of card faces, made the first time it's needed"""
+        if RegularDeck._FACES is None:
+            RegularDeck._FACES = tuple(_face(r, s) for s in range(1, 5) for r in range(1, 14))
+        return(RegularDeck._FACES)
+
+
+    @classmethod
+    def packed(cls, refresh:bool=False, rng=None):
+        """Make a PackedDeck of the 52 cards that shares the face table"""
+        return(PackedDeck.from_faces(cls.faces(), refresh, rng))
+
 ###
 
+import random
 import unittest
 
 class TestRegularDeck(unittest.TestCase):
 
     def test_create(self):
         deck = RegularDeck()
-        print([(c.rank, c.suit, c.icon) for c in deck.CARDS])
+        self.assertEqual(deck.size(), 52, "Full deck")
+        print([(c.rank, c.suit, c.icon) for c in deck.peek(52)])
 
     def test_queens(self):
-        deck = RegularDeck()
         print("QUEENS")
         for s in range(4):
-            print(deck.CARDS[11+13*s].icon)
+            print(RegularDeck.faces()[11+13*s][3])
 
     def test_kings(self):
-        deck = RegularDeck()
         print("KINGS")
         for s in range(4):
-            print(deck.CARDS[12+13*s].icon)
+            print(RegularDeck.faces()[12+13*s][3])
+
+    def test_faces(self):
+        self.assertEqual(RegularDeck.faces()[0], (1, 1, 0, "\N{PLAYING CARD ACE OF SPADES}", "\N{PLAYING CARD BACK}"),
+                         "Ace of spades first")
+        self.assertEqual(RegularDeck.faces()[11][3], "\N{PLAYING CARD QUEEN OF SPADES}", "Queen skips the knight")
+        self.assertEqual(RegularDeck.faces()[12][3], "\N{PLAYING CARD KING OF SPADES}", "King skips the knight")
+        self.assertIs(RegularDeck.faces(), RegularDeck.faces(), "Faces are made once")
+
+    def test_cards_deprecated(self):
+        with self.assertWarns(DeprecationWarning):
+            first = RegularDeck.CARDS
+        with self.assertWarns(DeprecationWarning):
+            second = RegularDeck.CARDS
+
+        self.assertEqual([(c.rank, c.suit, c.color, c.icon, c.back) for c in first],
+                         list(RegularDeck.faces()),
+                         "Cards should match the faces")
+        first[0].show()
+        self.assertTrue(second[0].is_hidden(), "Cards are made afresh each time")
+
+    def test_arguments(self):
+        self.assertEqual(RegularDeck().size(), 52, "Full deck by default")
+        self.assertEqual(RegularDeck([Card(1)], True).size(), 1, "Cards can be given, as before")
+        self.assertTrue(RegularDeck(None, True).refresh, "Refresh is still second")
+        self.assertRaises(TypeError, RegularDeck, None, False, random.Random(1))
+
+        first = RegularDeck(rng=random.Random(3))
+        second = RegularDeck(rng=random.Random(3))
+        first.shuffle()
+        second.shuffle()
+        self.assertEqual([(c.rank, c.suit) for c in first.peek(52)],
+                         [(c.rank, c.suit) for c in second.peek(52)],
+                         "Same seed should mix the same way")
+
+    def test_no_aliasing(self):
+        first = RegularDeck()
+        second = RegularDeck()
+        self.assertEqual(first.size(), 52, "Full deck")
+
+        first.peek()[0].show()
+        first.peek()[0].rotate(1)
+        self.assertTrue(second.peek()[0].is_hidden(), "Other decks' cards are separate")
+        self.assertFalse(second.peek()[0].is_rotated(), "Other decks' cards are separate")
+
+    def test_packed(self):
+        first = RegularDeck.packed()
+        second = RegularDeck.packed()
+        self.assertEqual(first.size(), 52, "Full deck")
+        self.assertIs(first._faces, second._faces, "Face table is shared")
+
+        first._cards[0] = PackedDeck.shown(first._cards[0])
+        self.assertFalse(first.card(first._cards[0]).is_hidden(), "Card state is per deck")
+        self.assertTrue(second.card(second._cards[0]).is_hidden(), "Card state is per deck")
+
+        card = first.card(first.peek()[0])
+        self.assertEqual((card.rank, card.suit), (13, 4), "King of diamonds on top")
+
 
 if __name__ == '__main__':
     unittest.main()
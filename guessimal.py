@@ -1,36 +1,214 @@
 #!/usr/bin/env python
 """Classic guess-the-animal game, with disk storage of a guess tree"""
 
-import pickle # to serialize/unserialize the data file
+import bisect
+import collections
+import difflib
+import json
+import math
+import mmap
+import os
+import pickle # to read data files from before the node table format
+import struct
+import sys
+import zlib
+
+try:
+    from sys import intern # Python 3
+except ImportError:
+    pass # Python 2 has it built in
+
+def _intern(text):
+    """One shared copy of each clue or animal, where possible (Python 2
+    can't intern unicode text)"""
+    try:
+        return intern(text)
+    except TypeError:
+        return text
+
+def tidy_text(text):
+    """Text as it should be kept: trimmed, with single spaces"""
+    return " ".join(text.split())
+
+def _casefold(text):
+    try:
+        return text.casefold() # Python 3
+    except AttributeError:
+        return text.lower()
+
+ARTICLES = ("a", "an", "the")
+
+def animal_key(text):
+    """What two names for one animal have in common: "A  Cat" and
+    "the cat" are both "cat" """
+    words = _casefold(text).split()
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+def clue_key(text):
+    return " ".join(_casefold(text).split())
+
+def _letter_pairs(key):
+    return [key[start:start + 2] for start in range(len(key) - 1)]
+
+def _fsync_directory(file_name):
+    """Make sure a file renamed into the directory stays renamed"""
+    try:
+        directory = os.open(os.path.dirname(os.path.abspath(file_name)), os.O_RDONLY)
+    except OSError:
+        return # can't open directories here (Windows)
+    try:
+        os.fsync(directory)
+    except OSError:
+        pass
+    finally:
+        os.close(directory)
+
+def _walk(node):
+    """Yield a node and every node under it, parents first, without recursing"""
+    waiting = [node]
+    while waiting:
+        node = waiting.pop()
+        yield node
+        for answer in ('n', 'y'):
+            child = node.get_child(answer)
+            if child is not None:
+                waiting.append(child)
 
 # Class to represent a binary tree of clues with leaf nodes representing
 # animals
 #
-class Node:
-    """Represents a tree of clues and animals at leaves"""
+class Node(object):
+    """Represents a tree of clues and animals at leaves
+
+    Trees run to millions of nodes, so each one has fixed slots for its
+    text and its two children, rather than a dict of attributes and a
+    dict of children."""
+
+    __slots__ = ('text', 'yes', 'no', 'parent', 'index')
 
     def __init__(self, my_text, parent_node=None, parent_answer=None):
         """Optionally attach a new node to a parent's Y or N answer"""
-        self.text = my_text
-        self.children = {}
+        self.text = _intern(my_text)
+        self.yes = None
+        self.no = None
+        self.parent = None
+        self.index = None
         if parent_node and parent_answer:
             parent_node.set_child(self, parent_answer)
 
+    @property
+    def children(self):
+        """The children as a dict of answer: node, as older versions kept them"""
+        children = {}
+        if self.yes is not None:
+            children['y'] = self.yes
+        if self.no is not None:
+            children['n'] = self.no
+        return children
+
     def is_leaf(self):
         """Returns True if the current node is a leaf"""
-        return self.children is None or len(self.children.keys()) == 0
+        return self.yes is None and self.no is None
 
     def set_child(self, child_node, my_answer):
-        """Hook a new node under the current one, at the answer point"""
-        self.children[my_answer] = child_node
+        """Hook a new node under the current one, at the answer point,
+        keeping the tree's index (if it has one) up to date"""
+        if my_answer not in ('y', 'n'):
+            raise ValueError("Children hang from 'y' or 'n', not %r" % (my_answer,))
+
+        index = self.index
+        if index is not None:
+            old_node = self.get_child(my_answer)
+            if old_node is not None and old_node is not child_node:
+                index.remove_tree(old_node)
+            index.remove(self) # may be about to turn from animal into clue
+
+        if my_answer == 'y':
+            self.yes = child_node
+        else:
+            self.no = child_node
+        child_node.parent = self
+
+        if index is not None:
+            index.add(self)
+            index.add_tree(child_node)
 
     def get_child(self, my_answer):
         """Return the child hung from the answer, if any, or None"""
-        if self.children and my_answer in self.children:
-            return self.children[my_answer]
+        if my_answer == 'y':
+            return self.yes
+        elif my_answer == 'n':
+            return self.no
         else:
             return None
 
+    # Pickling: only the text and children are kept. Older versions
+    # pickled a dict of text and children, which still loads.
+
+    def __getstate__(self):
+        return (self.text, self.yes, self.no)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            children = state.get('children') or {}
+            state = (state['text'], children.get('y'), children.get('n'))
+        text, yes, no = state
+        self.text = _intern(text)
+        self.yes = yes
+        self.no = no
+        self.parent = None
+        self.index = None
+        for child in (yes, no):
+            if child is not None:
+                child.parent = self
+
+
+    def walk(self):
+        """Yield every node under this one, parents before children,
+        without recursing: learned trees grow long chains, deeper than
+        Python's recursion limit"""
+        return _walk(self)
+
+
+    def add_clue(self, path, leaf_text, clue_text, animal_text):
+        """Learn a new animal under the root node: the leaf reached by
+        following the path of answers is replaced by a new clue, with
+        the new animal on its "y" side and the old leaf on its "n" side.
+
+        If the path now leads to clues added since (down their "n"
+        sides) the animal goes below them, and if the clue is already
+        there nothing changes. Returns the root node, which is new if
+        the root itself was the leaf."""
+        parent = None
+        answer = None
+        node = self
+        for answer_step in path:
+            parent, answer = node, answer_step
+            node = node.get_child(answer_step)
+            if node is None:
+                return self # the path doesn't fit this tree
+
+        while not (node.is_leaf() and node.text == leaf_text):
+            if node.is_leaf():
+                return self # some other animal: the path doesn't fit
+            yes_node = node.get_child('y')
+            if node.text == clue_text and yes_node is not None and yes_node.text == animal_text:
+                return self # already learned
+            parent, answer = node, 'n'
+            node = node.get_child('n')
+            if node is None:
+                return self
+
+        new_clue = Node(clue_text, parent, answer)
+        if parent is None:
+            new_clue.index = node.index # the new root takes over the index
+            node.parent = None
+        new_clue.set_child(node, 'n')
+        Node(animal_text, new_clue, 'y')
+        return self if parent else new_clue
+
 
     @classmethod
     def init_tree(cls):
@@ -50,44 +228,818 @@ class Node:
 
     @classmethod
     def load_tree(cls, file_name):
-        """Load a tree, or on failure, use a default tree from the class"""
+        """Load a tree, or on failure, use a default tree from the class.
+
+        Data files pickled by older versions are converted to a node
+        table the first time they are loaded."""
         if file_name != None:
             # Try loading from the supplied file
             try:
-                data_file = open(file_name, "rb")
-                root_node = pickle.load(data_file)
+                if NodeTable.is_table(file_name):
+                    root_node = NodeTable.open(file_name).to_tree()
+                else:
+                    root_node = migrate_tree(file_name)
             except IOError:
                 # bad things happened, so just return the default tree
                 root_node = Node.init_tree()
         else:
             root_node = Node.init_tree()
+        TreeIndex(root_node)
         return root_node
 
 
     def save_tree(self, file_name):
         """Archive the tree for future games"""
         try:
-            data_file = open(file_name, "w")
-            pickle.dump(self, data_file, 0) # using ASCII save protocol
+            # write alongside, then swap in, so a crash can't leave half a
+            # file; both on disk before the caller clears the journal
+            temp_name = file_name + ".tmp"
+            data_file = open(temp_name, "wb")
+            try:
+                data_file.write(NodeTable.dumps(self))
+                data_file.flush()
+                os.fsync(data_file.fileno())
+            finally:
+                data_file.close()
+            os.rename(temp_name, file_name)
+            _fsync_directory(file_name)
         except IOError as err:
             print("ERROR: could not save data file")
             raise err
 
+###
+# Finding animals and clues without walking the tree
+
+class TreeIndex:
+    """Every node in a tree by its text: animals (leaves) and clues
+
+    Building the index hooks it onto every node, and from then on
+    Node.set_child keeps it current as the tree grows, so finding out
+    whether an animal is known, or how to reach it, doesn't need the
+    whole tree walked. The index is the root node's index attribute.
+
+    Texts are looked up by animal_key() or clue_key(), so differences
+    of case, spacing or article don't make a new animal. Close matches
+    (typos) can be found with similar_animal(), which looks for two
+    letters swapped, and otherwise only compares animals with enough
+    letter pairs in common.
+    """
+
+    # how alike two animal names must be for similar_animal, from 0 to 1
+    SIMILAR = 0.85
+
+    def __init__(self, root_node):
+        self.animals = {} # animal_key: [leaf nodes]
+        self.clues = {}   # clue_key: [clue nodes]
+        self._pairs = None # letter pair: [animal_key, once per time in it], when needed
+        root_node.parent = None
+        self.add_tree(root_node)
+
+    def __len__(self):
+        return sum(len(nodes) for nodes in self.animals.values()) + \
+               sum(len(nodes) for nodes in self.clues.values())
+
+    def _nodes(self, node):
+        """The dict the node belongs in, and its key there"""
+        if node.is_leaf():
+            return self.animals, animal_key(node.text)
+        return self.clues, clue_key(node.text)
+
+    def add(self, node):
+        """Index one node, as an animal or a clue depending on its children"""
+        nodes, key = self._nodes(node)
+        if nodes is self.animals and key not in nodes and self._pairs is not None:
+            for pair in _letter_pairs(key):
+                self._pairs.setdefault(pair, []).append(key)
+        nodes.setdefault(key, []).append(node)
+        node.index = self
+
+    def remove(self, node):
+        """Forget one node"""
+        nodes, key = self._nodes(node)
+        indexed = nodes.get(key, [])
+        for number, each in enumerate(indexed):
+            if each is node:
+                del indexed[number]
+                break
+        if not indexed and key in nodes:
+            del nodes[key]
+            if nodes is self.animals and self._pairs is not None:
+                for pair in _letter_pairs(key):
+                    self._pairs[pair].remove(key)
+        node.index = None
+
+    def add_tree(self, node):
+        """Index a node and everything under it, if not indexed already"""
+        if node.index is self:
+            return
+        for each in node.walk():
+            self.add(each)
+
+    def remove_tree(self, node):
+        """Forget a node and everything under it"""
+        for each in node.walk():
+            if each.index is self:
+                self.remove(each)
+
+    def animal(self, text):
+        """A leaf for the animal, or None"""
+        nodes = self.animals.get(animal_key(text))
+        return nodes[0] if nodes else None
+
+    def similar_animal(self, text):
+        """A leaf for an animal whose name is close to this one (a typo,
+        a plural...), or None"""
+        key = animal_key(text)
+        if key in self.animals:
+            return self.animals[key][0]
+        # two letters swapped: difflib rates that low in short names
+        for start in range(len(key) - 1):
+            swapped = key[:start] + key[start + 1] + key[start] + key[start + 2:]
+            if swapped in self.animals:
+                return self.animals[swapped][0]
+        close = difflib.get_close_matches(key, self._near(key), 1, TreeIndex.SIMILAR)
+        return self.animals[close[0]][0] if close else None
+
+    def _near(self, key):
+        """The animal keys that could be SIMILAR to key, so difflib
+        needn't compare against every animal.
+
+        Matches share whole blocks of letters, so the letter pairs inside
+        them. With M letters matched in B blocks out of T in both names,
+        at least M - B pairs are shared, and B - 1 can't be more than the
+        T - 2M letters left unmatched. As difflib's ratio is 2M / T, that
+        leaves a smallest number of shared pairs, and a range of lengths,
+        for each ratio above 2/3."""
+        similar = TreeIndex.SIMILAR
+        if similar <= 2 / 3.0:
+            return list(self.animals)
+        if self._pairs is None:
+            self._pairs = {}
+            for animal in self.animals:
+                for pair in _letter_pairs(animal):
+                    self._pairs.setdefault(pair, []).append(animal)
+
+        shared = collections.Counter()
+        for pair in set(_letter_pairs(key)):
+            shared.update(self._pairs.get(pair, ()))
+        fewest = (3 * similar - 2) / (2 - similar) * len(key) - 1
+        shortest = len(key) * similar / (2 - similar)
+        longest = len(key) * (2 - similar) / similar
+        return [animal for animal, count in shared.items()
+                if count >= fewest and shortest <= len(animal) <= longest]
+
+    def clue_nodes(self, text):
+        """Every node that asks the clue"""
+        return list(self.clues.get(clue_key(text), ()))
+
+    @staticmethod
+    def path(node):
+        """The answers from the root that lead to a node"""
+        answers = []
+        while node.parent is not None:
+            answers.append('y' if node.parent.get_child('y') is node else 'n')
+            node = node.parent
+        return "".join(reversed(answers))
+
+    def explain(self, text):
+        """Return [(clue text, answer)] from the root down to an animal,
+        or None if it isn't known"""
+        leaf = self.animal(text)
+        if leaf is None:
+            return None
+        steps = []
+        node = leaf
+        while node.parent is not None:
+            answer = 'y' if node.parent.get_child('y') is node else 'n'
+            steps.append((node.parent.text, answer))
+            node = node.parent
+        return steps[::-1]
+
+###
+# Compact storage for the tree
+
+def _utf8(text):
+    """Text as UTF-8 bytes, from either Python 2 or 3 strings"""
+    return text if isinstance(text, bytes) else text.encode("utf-8")
+
+class NodeTable:
+    """A tree of nodes packed into a flat, memory-mappable format
+
+    After a small header come fixed-width records, one per node, that
+    refer to their "y" and "n" children by record number (the root is
+    record 0), then a pool of UTF-8 text that the records point into.
+    A table opened from a file is memory-mapped, and its nodes can be
+    walked through table_node() without reading in the whole tree.
+    """
+
+    MAGIC = b"GSML"
+    VERSION = 1
+
+    HEADER = struct.Struct("<4sHHI") # magic, version, unused, node count
+    RECORD = struct.Struct("<IIii")  # text offset, text length, "y" child, "n" child
+    NO_CHILD = -1
+
+    def __init__(self, buffer):
+        """Read the table in a buffer (bytes, or an mmap)"""
+        if len(buffer) < NodeTable.HEADER.size:
+            raise ValueError("Not a guessimal node table")
+        magic, version, unused, count = NodeTable.HEADER.unpack_from(buffer, 0)
+        if magic != NodeTable.MAGIC or version != NodeTable.VERSION:
+            raise ValueError("Not a guessimal node table")
+
+        self._buffer = buffer
+        self.count = count
+        self._pool = NodeTable.HEADER.size + count * NodeTable.RECORD.size
+        if len(buffer) < self._pool:
+            raise ValueError("Guessimal node table is cut short")
+
+    @classmethod
+    def open(cls, file_name):
+        """Memory-map a table file"""
+        data_file = open(file_name, "rb")
+        try:
+            return cls(mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ))
+        finally:
+            data_file.close()
+
+    @staticmethod
+    def is_table(file_name):
+        """Returns True if the file holds a node table, not a pickle"""
+        data_file = open(file_name, "rb")
+        try:
+            return data_file.read(len(NodeTable.MAGIC)) == NodeTable.MAGIC
+        finally:
+            data_file.close()
+
+    def record(self, number):
+        """Returns (text offset, text length, "y" child, "n" child)"""
+        return NodeTable.RECORD.unpack_from(self._buffer,
+                                            NodeTable.HEADER.size + number * NodeTable.RECORD.size)
+
+    def text(self, number):
+        offset, length, yes, no = self.record(number)
+        start = self._pool + offset
+        return self._buffer[start:start + length].decode("utf-8")
+
+    def table_node(self, number=0):
+        """A read-only stand-in for one Node, the root by default"""
+        return TableNode(self, number)
+
+    def to_tree(self):
+        """Build Node objects for the whole table, returning the root"""
+        nodes = [Node(self.text(number)) for number in range(self.count)]
+        for number, node in enumerate(nodes):
+            offset, length, yes, no = self.record(number)
+            if yes != NodeTable.NO_CHILD:
+                node.set_child(nodes[yes], 'y')
+            if no != NodeTable.NO_CHILD:
+                node.set_child(nodes[no], 'n')
+        return nodes[0]
+
+    @staticmethod
+    def dumps(root_node):
+        """Pack the tree under a node into a table, returned as bytes.
+
+        Only the "y" and "n" answers are kept."""
+
+        # Number the nodes, root first, without recursing
+        nodes = []
+        numbers = {}
+        waiting = [root_node]
+        while waiting:
+            node = waiting.pop()
+            if id(node) in numbers:
+                continue
+            numbers[id(node)] = len(nodes)
+            nodes.append(node)
+            for answer in ('n', 'y'):
+                child = node.get_child(answer)
+                if child is not None:
+                    waiting.append(child)
+
+        # Text that appears more than once is only stored once
+        pool = []
+        pool_size = 0
+        offsets = {}
+        records = []
+        for node in nodes:
+            text = _utf8(node.text)
+            if text not in offsets:
+                offsets[text] = pool_size
+                pool.append(text)
+                pool_size += len(text)
+
+            children = []
+            for answer in ('y', 'n'):
+                child = node.get_child(answer)
+                children.append(NodeTable.NO_CHILD if child is None else numbers[id(child)])
+
+            records.append(NodeTable.RECORD.pack(offsets[text], len(text), *children))
+
+        header = NodeTable.HEADER.pack(NodeTable.MAGIC, NodeTable.VERSION, 0, len(nodes))
+        return header + b"".join(records) + b"".join(pool)
+
+
+class TableNode(object):
+    """One node of a NodeTable, answering the same questions as a Node"""
+
+    __slots__ = ('table', 'number', '_record')
+
+    def __init__(self, table, number):
+        self.table = table
+        self.number = number
+        self._record = table.record(number) # text offset, length, children
+
+    @property
+    def text(self):
+        return self.table.text(self.number)
+
+    def is_leaf(self):
+        """Returns True if the current node is a leaf"""
+        return self._record[2] == NodeTable.NO_CHILD and self._record[3] == NodeTable.NO_CHILD
+
+    def get_child(self, my_answer):
+        """Return the child hung from the answer, if any, or None"""
+        if my_answer == 'y':
+            child = self._record[2]
+        elif my_answer == 'n':
+            child = self._record[3]
+        else:
+            return None
+        if child == NodeTable.NO_CHILD:
+            return None
+        return TableNode(self.table, child)
+
+    def walk(self):
+        """Yield every node under this one, parents before children"""
+        return _walk(self)
+
+###
+# Learning, one animal at a time
+
+class TreeJournal:
+    """An append-only log of animals learned since the tree was saved
+
+    Each record holds the path of answers to the leaf that was wrong,
+    the leaf's text, the new clue and the new animal, with a length and
+    checksum in front so a record cut short by a crash can be spotted
+    and dropped. Replaying the log over the saved tree rebuilds the tree
+    as it was; replaying a record that is already in the tree is
+    harmless, so the log can be cleared after the tree is saved.
+    """
+
+    RECORD = struct.Struct("<II") # length, CRC-32 of the text after it
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.count = 0
+
+    def append(self, path, leaf_text, clue_text, animal_text):
+        """Add one learned animal to the log, and make sure it's on disk"""
+        data = b"\0".join(_utf8(text) for text in (path, leaf_text, clue_text, animal_text))
+        log_file = open(self.file_name, "ab")
+        try:
+            log_file.write(TreeJournal.RECORD.pack(len(data), zlib.crc32(data) & 0xffffffff))
+            log_file.write(data)
+            log_file.flush()
+            os.fsync(log_file.fileno())
+        finally:
+            log_file.close()
+        self.count += 1
+
+    def records(self):
+        """Return the (path, leaf, clue, animal) records in the log,
+        cutting off anything damaged at the end"""
+        try:
+            log_file = open(self.file_name, "rb")
+        except IOError:
+            return []
+        try:
+            data = log_file.read()
+        finally:
+            log_file.close()
+
+        records = []
+        offset = 0
+        header = TreeJournal.RECORD.size
+        while offset + header <= len(data):
+            length, checksum = TreeJournal.RECORD.unpack_from(data, offset)
+            text = data[offset + header:offset + header + length]
+            if len(text) < length or zlib.crc32(text) & 0xffffffff != checksum:
+                break
+            parts = [part.decode("utf-8") for part in text.split(b"\0")]
+            if len(parts) != 4:
+                break
+            records.append(tuple(parts))
+            offset += header + length
+
+        if offset < len(data):
+            # drop the damaged tail, so new records aren't lost behind it
+            log_file = open(self.file_name, "r+b")
+            try:
+                log_file.truncate(offset)
+            finally:
+                log_file.close()
+
+        self.count = len(records)
+        return records
+
+    def replay(self, root_node):
+        """Apply every record in the log to a tree, returning its root"""
+        for path, leaf_text, clue_text, animal_text in self.records():
+            root_node = root_node.add_clue(path, leaf_text, clue_text, animal_text)
+        return root_node
+
+    def clear(self):
+        """Empty the log, once the tree has been saved"""
+        open(self.file_name, "wb").close()
+        self.count = 0
+
+###
+# Reading data files from before the node table format
+
+def _unpickled_node():
+    # Old data files make nodes the way old-style classes were made,
+    # by calling the class with no arguments
+    return Node.__new__(Node)
+
+class _TreeUnpickler(pickle.Unpickler):
+    """Unpickle only Nodes, wherever they were pickled from (the game
+    used to run as __main__)"""
+
+    def find_class(self, module, name):
+        if name == "Node":
+            return _unpickled_node
+        raise pickle.UnpicklingError("Unexpected %s.%s in data file" % (module, name))
+
+def migrate_tree(file_name):
+    """Convert a pickled data file to a node table, keeping the original
+    as file_name.pickle. Returns the root node."""
+    data_file = open(file_name, "rb")
+    try:
+        root_node = _TreeUnpickler(data_file).load()
+    finally:
+        data_file.close()
+
+    os.rename(file_name, file_name + ".pickle")
+    root_node.save_tree(file_name)
+    return root_node
+
+###
+# Answering clues without a player
+
+def _answer(reply):
+    """'y', 'n' or None from an oracle's reply: True/False, None, or
+    text like "Y" or "no" """
+    if reply is None:
+        return None
+    if reply is True or reply is False:
+        return 'y' if reply else 'n'
+    reply = reply.lstrip().lower()
+    return reply[0] if reply[:1] in ('y', 'n') else None
+
+def classify(root_node, oracles):
+    """Play the tree for many animals at once, without prompting.
+
+    Each oracle answers clues for one animal: either a dict of clue text
+    to answer, or a function called with the clue text. Answers can be
+    True/False or "y"/"n". Oracles that reach the same node are grouped,
+    so each clue is visited (and its text read) once for the whole
+    batch, however many animals pass through it.
+
+    Returns a list with the node each oracle ended at, in order: the
+    leaf guessed, or the clue it had no answer for. Works on a Node tree
+    or a TableNode from a NodeTable."""
+    oracles = list(oracles)
+    results = [None] * len(oracles)
+
+    waiting = [(root_node, list(range(len(oracles))))]
+    while waiting:
+        node, members = waiting.pop()
+        if node.is_leaf():
+            for member in members:
+                results[member] = node
+            continue
+
+        clue_text = node.text
+        groups = {'y': [], 'n': []}
+        for member in members:
+            oracle = oracles[member]
+            if callable(oracle):
+                answer = _answer(oracle(clue_text))
+            else:
+                answer = _answer(oracle.get(clue_text))
+
+            if answer in groups and node.get_child(answer) is not None:
+                groups[answer].append(member)
+            else:
+                results[member] = node # stuck at this clue
+
+        for answer in ('n', 'y'):
+            if groups[answer]:
+                waiting.append((node.get_child(answer), groups[answer]))
+
+    return results
+
+###
+# Rebuilding a learned tree so it asks fewer questions
+
+def question_counts(root_node):
+    """Return the average and worst number of clues asked before
+    guessing, over every animal in the tree"""
+    total = leaves = worst = 0
+    waiting = [(root_node, 0)]
+    while waiting:
+        node, depth = waiting.pop()
+        if node.is_leaf():
+            total += depth
+            leaves += 1
+            worst = max(worst, depth)
+            continue
+        for answer in ('n', 'y'):
+            child = node.get_child(answer)
+            if child is not None:
+                waiting.append((child, depth + 1))
+    return float(total) / leaves, worst
+
+def _split_entropy(yes_count, no_count):
+    total = float(yes_count + no_count)
+    return -sum(count / total * math.log(count / total, 2)
+                for count in (yes_count, no_count) if count)
+
+class _OldTree(object):
+    """The tree being optimized, laid out so the answers on any animal's
+    path can be looked up without keeping a copy of the path for each one
+
+    Leaves are numbered in walk order, so the animals under any clue are
+    a run of numbers. A clue's answers are then ranges: animals numbered
+    in its "y" range answered it yes on the way, in its "n" range no. A
+    clue asked again further down the same path was already answered, so
+    only its topmost nodes count."""
+
+    def __init__(self, root_node):
+        nodes = list(root_node.walk())
+        numbers = dict((id(node), number) for number, node in enumerate(nodes))
+        self.child = [dict((answer, numbers[id(node.get_child(answer))]) for answer in ('y', 'n')
+                           if node.get_child(answer) is not None)
+                      for node in nodes]
+        self.children = [[child[answer] for answer in ('y', 'n') if answer in child]
+                         for child in self.child]
+
+        # leaves under each node, then the first leaf's number
+        self.count = [0] * len(nodes)
+        for number in range(len(nodes) - 1, -1, -1):
+            children = self.children[number]
+            self.count[number] = sum(self.count[child] for child in children) if children else 1
+        self.first = [0] * len(nodes)
+        for number in range(len(nodes)):
+            start = self.first[number]
+            for child in self.children[number]:
+                self.first[child] = start
+                start += self.count[child]
+
+        # each node's parent, and an ancestor further up to jump to,
+        # picked so climbing any path takes a logarithmic number of jumps
+        self.parent = [0] * len(nodes)
+        self.jump = [0] * len(nodes)
+        depth = [0] * len(nodes)
+        for number in range(len(nodes)):
+            up = self.jump[number]
+            for child in self.children[number]:
+                self.parent[child] = number
+                depth[child] = depth[number] + 1
+                if depth[number] - depth[up] == depth[up] - depth[self.jump[up]]:
+                    self.jump[child] = self.jump[up]
+                else:
+                    self.jump[child] = number
+
+        self.nodes = nodes
+        self.leaf_numbers = [number for number, node in enumerate(nodes) if node.is_leaf()]
+        self.leaves = [nodes[number] for number in self.leaf_numbers]
+        self.texts = {}  # clue_key: text, as first asked
+        self.order = {}  # clue_key: order first asked, to settle ties
+        self.ranges = {} # clue_key: [(yes from, yes to, no from, no to)]
+        for number, node in enumerate(nodes):
+            if node.is_leaf():
+                continue
+            key = clue_key(node.text)
+            self.texts.setdefault(key, node.text)
+            self.order.setdefault(key, len(self.order))
+            self.ranges.setdefault(key, []).append(number)
+        for key, numbers in self.ranges.items():
+            self.ranges[key] = self._topmost(numbers)
+
+        # nodes with no clue under them that's asked on separate paths:
+        # the tree's own answers can only split those as they're split now
+        self.plain = [True] * len(nodes)
+        for number in range(len(nodes) - 1, -1, -1):
+            node = nodes[number]
+            if not node.is_leaf():
+                self.plain[number] = (len(self.ranges[clue_key(node.text)]) == 1 and
+                                      all(self.plain[child] for child in self.children[number]))
+
+    def _topmost(self, numbers):
+        """Answer ranges of the clue nodes that aren't under another one"""
+        ranges = []
+        end = -1
+        for number in numbers: # in walk order, so ancestors come first
+            start = self.first[number]
+            if start < end:
+                continue # under one already counted
+            end = start + self.count[number]
+            sides = []
+            for answer in ('y', 'n'):
+                child = self.child[number].get(answer)
+                if child is None:
+                    sides.extend((start, start)) # nobody answered this way
+                else:
+                    sides.extend((self.first[child], self.first[child] + self.count[child]))
+            ranges.append(tuple(sides))
+        return ranges
+
+    def copy(self, number, parent, answer):
+        """A copy of the tree under a node, hung from parent's answer"""
+        top = None
+        waiting = [(number, parent, answer)]
+        while waiting:
+            number, parent, answer = waiting.pop()
+            node = Node(self.nodes[number].text, parent, answer)
+            if top is None:
+                top = node
+            for answer, child in self.child[number].items():
+                waiting.append((child, node, answer))
+        return top
+
+    def path_answer(self, key, leaf):
+        """'y' or 'n' if the clue is on the way to the leaf, or None"""
+        for yes_from, yes_to, no_from, no_to in self.ranges.get(key, ()):
+            if yes_from <= leaf < yes_to:
+                return 'y'
+            if no_from <= leaf < no_to:
+                return 'n'
+        return None
+
+    def lowest_common(self, members):
+        """The lowest node over a sorted run of leaves: climbing from the
+        first leaf, by jumps while they stay short of the last one"""
+        number, last = self.leaf_numbers[members[0]], members[-1]
+        while not last < self.first[number] + self.count[number]:
+            jump = self.jump[number]
+            if last < self.first[jump] + self.count[jump]:
+                number = self.parent[number]
+            else:
+                number = jump
+        return number
+
+
+def _count_in(members, start, end):
+    """How many of the sorted members are in [start, end)"""
+    return bisect.bisect_left(members, end) - bisect.bisect_left(members, start)
+
+def optimize_tree(root_node, known=None):
+    """Build a new tree, asking the clues in the order that tells the
+    animals apart soonest, and return (new root, report).
+
+    Each animal's answers are the ones on its way through the tree, plus
+    any in known: a dict of animal text to {clue text: answer}, matched
+    by animal_key() and clue_key(). At every node the clue with the most
+    information gain among the remaining animals is asked, out of those
+    clues that every one of them has an answer for. With no more answers
+    than the tree's own, that gives back the same tree: the savings come
+    from the known answers.
+
+    Every animal is kept. Where no clue tells some animals apart (an
+    animal below a clue asked twice, answered both ways) they are split
+    as the old tree split them.
+
+    The report is a dict of the number of animals, and the average and
+    worst question counts before and after."""
+    old = _OldTree(root_node)
+    leaves = old.leaves
+
+    # Known answers the tree doesn't already have, by leaf and by clue
+    known_keys = {}
+    for animal_text, answers in (known or {}).items():
+        known_keys.setdefault(animal_key(animal_text), answers)
+    known_of = [{} for leaf in leaves] # leaf: {clue_key: answer}
+    for number, leaf in enumerate(leaves):
+        for clue_text, reply in (known_keys.get(animal_key(leaf.text)) or {}).items():
+            key, answer = clue_key(clue_text), _answer(reply)
+            if answer is None or old.path_answer(key, number) is not None:
+                continue
+            old.texts.setdefault(key, tidy_text(clue_text))
+            old.order.setdefault(key, len(old.order))
+            known_of[number][key] = answer
+    repeated = [key for key, ranges in old.ranges.items() if len(ranges) > 1]
+
+    def known_counts(members):
+        counts = {}
+        for member in members:
+            for key, answer in known_of[member].items():
+                counts.setdefault(key, {'y': 0, 'n': 0})[answer] += 1
+        return counts
+
+    def split(members, key, counts):
+        """The members that answer the clue yes, and no"""
+        sides = {'y': [], 'n': []}
+        for yes_from, yes_to, no_from, no_to in old.ranges.get(key, ()):
+            sides['y'].extend(members[bisect.bisect_left(members, yes_from):bisect.bisect_left(members, yes_to)])
+            sides['n'].extend(members[bisect.bisect_left(members, no_from):bisect.bisect_left(members, no_to)])
+        if key in counts:
+            for member in members:
+                answer = known_of[member].get(key)
+                if answer is not None:
+                    sides[answer].append(member)
+            sides['y'].sort()
+            sides['n'].sort()
+        return sides['y'], sides['n']
+
+    new_root = None
+    everyone = list(range(len(leaves)))
+    waiting = [(everyone, known_counts(everyone), None, None)]
+    while waiting:
+        members, counts, parent, answer = waiting.pop()
+        if len(members) == 1:
+            node = Node(leaves[members[0]].text, parent, answer)
+            if new_root is None:
+                new_root = node
+            continue
+
+        over = old.lowest_common(members)
+        if not counts and old.plain[over]:
+            node = old.copy(over, parent, answer)
+            if new_root is None:
+                new_root = node
+            continue
+
+        candidates = set(counts)
+        candidates.update(repeated)
+        candidates.add(clue_key(old.nodes[over].text))
+
+        best = None
+        for key in candidates:
+            count = dict(counts.get(key) or {'y': 0, 'n': 0})
+            for yes_from, yes_to, no_from, no_to in old.ranges.get(key, ()):
+                count['y'] += _count_in(members, yes_from, yes_to)
+                count['n'] += _count_in(members, no_from, no_to)
+            if count['y'] and count['n'] and count['y'] + count['n'] == len(members):
+                rank = (_split_entropy(count['y'], count['n']), -old.order[key])
+                if best is None or rank > best[0]:
+                    best = (rank, key)
+
+        if best is not None:
+            key = best[1]
+            node = Node(old.texts[key], parent, answer)
+            yes_members, no_members = split(members, key, counts)
+        else:
+            # nothing tells them apart: split them where the old tree did
+            node = Node(old.nodes[over].text, parent, answer)
+            first_child = old.children[over][0]
+            middle = bisect.bisect_left(members, old.first[first_child] + old.count[first_child])
+            yes_members, no_members = members[:middle], members[middle:]
+        if new_root is None:
+            new_root = node
+
+        # count the smaller side's known answers, and take them off the
+        # rest for the larger side, rather than counting both again
+        smaller, larger = sorted((yes_members, no_members), key=len)
+        smaller_counts = known_counts(smaller)
+        for key, count in smaller_counts.items():
+            left = counts[key]
+            left['y'] -= count['y']
+            left['n'] -= count['n']
+            if not (left['y'] or left['n']):
+                del counts[key]
+        for side_members, side in ((no_members, 'n'), (yes_members, 'y')):
+            side_counts = smaller_counts if side_members is smaller else counts
+            waiting.append((side_members, side_counts, node, side))
+
+    before = question_counts(root_node)
+    after = question_counts(new_root)
+    report = {"animals": len(leaves),
+              "average_before": before[0], "worst_before": before[1],
+              "average_after": after[0], "worst_after": after[1]}
+    return new_root, report
+
 ###
 # Some helpers to bridge python 2 & 3
 
 def input_yes_no(prompt_text):
     """Centralized Y/N handler for user input"""
-    try:
-        # Python 2
-        user_input = raw_input(prompt_text + " (Y/N) ")
-    except NameError:
-        # Python 3
-        user_input = input(prompt_text + " (Y/N) ")
+    while True:
+        try:
+            # Python 2
+            user_input = raw_input(prompt_text + " (Y/N) ")
+        except NameError:
+            # Python 3
+            user_input = input(prompt_text + " (Y/N) ")
 
-    # first character, lower-cased to make comparison easier
-    user_input = user_input.lstrip().lower()
-    return user_input[0]
+        # first character, lower-cased to make comparison easier; ask
+        # again if it's neither (or there isn't one)
+        user_input = user_input.lstrip().lower()
+        if user_input[:1] in ('y', 'n'):
+            return user_input[0]
 
 
 def input_text(prompt_text):
@@ -99,87 +1051,530 @@ def input_text(prompt_text):
         # Python 3
         user_input = input(prompt_text)
 
-    # lop off leading and trailing whitespace
-    user_input = user_input.lstrip().rstrip()
-    return user_input
+    # lop off leading and trailing whitespace, and any doubled up inside
+    return tidy_text(user_input)
 
 ###
 
-class Guessimal:
-    """Prompt user for clues by walking the tree, and adding new nodes"""
+class Guessimal(object):
+    """Prompt user for clues by walking the tree, and adding new nodes
+
+    A saved tree is played straight from its memory-mapped node table.
+    It's only read in as Nodes (see root_node) when the game needs to
+    change it or look through it, or when the journal has animals
+    learned since it was saved."""
+
+    # Learned animals are logged one by one, and the whole tree is only
+    # saved after this many
+    SAVE_EVERY = 20
 
     def __init__(self, file_name="guessimal.data"):
-        """Begin a new game, loading from a file"""
+        """Begin a new game, loading from a file and its journal"""
 
         self.previous_clue = None
         self.previous_response = None
+        self.path = []
 
         self.data_file = file_name
-        self.root_node = Node.load_tree(self.data_file)
+        self.journal = TreeJournal(file_name + ".log")
+        self.table = None
+        self._root_node = None
 
+        try:
+            if not self.journal.records() and NodeTable.is_table(file_name):
+                self.table = NodeTable.open(file_name)
+        except IOError:
+            pass # no saved tree yet
+        if self.table is None:
+            self.root_node # read in now
 
-    def process_node(self, current_node):
-        """Handle each node appropriately: leaves are animals, others are clues"""
-        if current_node.is_leaf():
-            # Found an animal...
-            user_response = input_yes_no("Is your animal " + current_node.text + "?")
-            # but if it's the wrong one, then the tree gets extended
-            if user_response == 'n':
 
-            #  self.add_clue(self, self.previous_clue, self.previous_response, current_node)
-            # ->
-            #  def add_clue(self, parent_node, parent_response, wrong_animal):
+    @property
+    def root_node(self):
+        """The tree as Nodes, read in the first time it's asked for"""
+        if self._root_node is None:
+            self._root_node = self.journal.replay(Node.load_tree(self.data_file))
+            self.table = None
+        return self._root_node
 
+    @root_node.setter
+    def root_node(self, root_node):
+        self._root_node = root_node
+        self.table = None
 
-                print("""
-OK, you stumped me. Tell me the animal you were thinking of so I can learn it.
 
-Be sure to add "a" or "an" in front of the animal's name, like "a giraffe"
-""")
+    def start_node(self):
+        """The root to play from: the saved table's, if it hasn't been
+        read in as Nodes"""
+        if self._root_node is None:
+            return self.table.table_node()
+        return self._root_node
 
-                animal_reply = 'n'
-                while animal_reply != 'y':
-                    animal_text = input_text("Your animal is: ")
-                    animal_reply = input_yes_no("Your animal is " + animal_text + ", is this OK?")
 
-                print("Teach me what makes %s different from %s" % (animal_text, current_node.text))
-                print("Please finish this clue:")
+    def learn(self, path, leaf_text, clue_text, animal_text):
+        """Add a new animal to the tree and the journal"""
+        self.journal.append(path, leaf_text, clue_text, animal_text)
+        self.root_node = self.root_node.add_clue(path, leaf_text, clue_text, animal_text)
+        if self.journal.count >= Guessimal.SAVE_EVERY:
+            self.save()
 
-                clue_reply = 'n'
-                while clue_reply != 'y':
-                    clue_text = input_text(animal_text)
-                    clue_reply = input_yes_no("The clue is: %s %s, is this OK?" % (animal_text, clue_text))
 
-                    # Now set up a new node and hook it to the 'n' response of
-                    # the parent: this is the path that led us to the bad
-                    # guess
+    def save(self):
+        """Save the whole tree, so the journal can start again"""
+        self.root_node.save_tree(self.data_file)
+        self.journal.clear()
 
-                    #
-                    # Replace the old animal leaf with a new clue node, with its own animal leaves...
-                    new_clue = Node(clue_text, self.previous_clue, self.previous_response)
-                    new_clue.set_child(current_node, 'n')
-                    Node(animal_text, new_clue, 'y')
 
-                print("Thanks! I'm saving the clues for next time.")
-                self.root_node.save_tree(self.data_file)
-            else:
-                print("I am very clever! YAY ME!")
+    def explain(self, animal_text):
+        """Print the answers that lead to an animal"""
+        steps = self.root_node.index.explain(animal_text)
+        if steps is None:
+            print("I don't know %s." % animal_text)
+            return
+        for clue_text, answer in steps:
+            print("  Your animal %s? %s" % (clue_text, "Yes" if answer == 'y' else "No"))
 
-        else:
-            # Found a clue, so ask it and recurse into the subtree
+
+    def process_node(self, current_node):
+        """Handle each node appropriately: leaves are animals, others are clues"""
+        while not current_node.is_leaf():
+            # Found a clue, so ask it and carry on down the tree, one
+            # question at a time rather than recursing (the tree can
+            # get very deep)
             self.previous_clue = current_node # parent of new leaf node
 
             user_response = input_yes_no("Your animal " + current_node.text + "?")
+            next_node = current_node.get_child(user_response)
+            if next_node is None:
+                continue # not a Y or N, so ask again
+
             self.previous_response = user_response
+            self.path.append(user_response)
+            current_node = next_node
+
+        # Found an animal...
+        user_response = input_yes_no("Is your animal " + current_node.text + "?")
+        # but if it's the wrong one, then the tree gets extended
+        if user_response == 'n':
+
+            print("""
+OK, you stumped me. Tell me the animal you were thinking of so I can learn it.
+
+Be sure to add "a" or "an" in front of the animal's name, like "a giraffe"
+""")
+
+            animal_reply = 'n'
+            while animal_reply != 'y':
+                animal_text = input_text("Your animal is: ")
+                animal_reply = input_yes_no("Your animal is " + animal_text + ", is this OK?")
+
+            # learning an animal again would leave two leaves for it
+            known = self.root_node.index.animal(animal_text)
+            if known is None:
+                similar = self.root_node.index.similar_animal(animal_text)
+                if similar is not None and input_yes_no("Did you mean " + similar.text + "?") == 'y':
+                    known = similar
+            if known is not None:
+                print("But I already know %s! This is how I find it:" % known.text)
+                self.explain(known.text)
+                return
+
+            print("Teach me what makes %s different from %s" % (animal_text, current_node.text))
+            print("Please finish this clue:")
 
-            self.process_node(current_node.get_child(user_response))
+            clue_reply = 'n'
+            while clue_reply != 'y':
+                clue_text = input_text(animal_text)
+                clue_reply = input_yes_no("The clue is: %s %s, is this OK?" % (animal_text, clue_text))
+
+            # Replace the old animal leaf with a new clue node, with
+            # its own animal leaves, at the end of the path of
+            # answers that led us to the bad guess
+
+            print("Thanks! I'm saving the clues for next time.")
+            self.learn("".join(self.path), current_node.text, clue_text, animal_text)
+        else:
+            print("I am very clever! YAY ME!")
 
 ###
 
 def play_and_save():
     """Play one round of the guessing-animal-game, and save on completion"""
     game = Guessimal()
-    game.process_node(game.root_node)
+    game.process_node(game.start_node())
+
+def optimize_and_save(answers_file, file_name="guessimal.data"):
+    """Rebuild the saved tree to ask fewer questions, using the answers
+    in a JSON file of {animal: {clue: "y" or "n"}}, and report on it.
+    The tree is only saved if it got better."""
+    with open(answers_file) as answers:
+        known = json.load(answers)
+    game = Guessimal(file_name)
+    new_root, report = optimize_tree(game.root_node, known)
+
+    print("%d animals" % report["animals"])
+    print("Questions before: %.2f on average, %d at worst" % (report["average_before"], report["worst_before"]))
+    print("Questions after:  %.2f on average, %d at worst" % (report["average_after"], report["worst_after"]))
+    if report["average_after"] < report["average_before"]:
+        game.root_node = new_root
+        game.save()
+    else:
+        print("No better than before, so the tree was left as it is")
+
+###
+
+import shutil
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO # Python 2
+except ImportError:
+    from io import StringIO
+
+# A data file as the game pickled it before the node table format
+OLD_DATA = (b"(i__main__\nNode\np0\n(dp1\nS'text'\np2\nS'has four legs'\np3\nsS'children'\np4\n"
+            b"(dp5\nS'y'\np6\n(i__main__\nNode\np7\n(dp8\ng2\nS'a cat'\np9\nsg4\n(dp10\nsbsS'n'\n"
+            b"p11\n(i__main__\nNode\np12\n(dp13\ng2\nS'has wings'\np14\nsg4\n(dp15\ng6\n(i__main__\n"
+            b"Node\np16\n(dp17\ng2\nS'a raven'\np18\nsg4\n(dp19\nsbsg11\n(i__main__\nNode\np20\n"
+            b"(dp21\ng2\nS'a garter snake'\np22\nsg4\n(dp23\nsbssbssb.")
+
+def _shape(root_node):
+    """The tree as [(text, is leaf)] in walk order, to compare trees"""
+    return [(node.text, node.is_leaf()) for node in root_node.walk()]
+
+class GuessimalTestCase(unittest.TestCase):
+    """Each test gets a directory of its own, and scripted players"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.directory, "guessimal.data")
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def script(self, answers, texts=()):
+        """Play with the given Y/N answers and typed texts, quietly"""
+        answers = iter(answers)
+        texts = iter(texts)
+        module = globals()
+        self.addCleanup(module.update, input_yes_no=input_yes_no, input_text=input_text)
+        self.addCleanup(setattr, sys, "stdout", sys.stdout)
+
+        module["input_yes_no"] = lambda prompt_text: next(answers)
+        module["input_text"] = lambda prompt_text: next(texts)
+        sys.stdout = StringIO()
+
+    def learned_tree(self):
+        root_node = Node.init_tree()
+        TreeIndex(root_node)
+        root_node = root_node.add_clue("yy", "a dog", "purrs", "a cat")
+        return root_node.add_clue("nn", "a garter snake", "lives in water", "a frog")
+
+
+class TestTreeIndex(GuessimalTestCase):
+
+    def test_animal_key(self):
+        self.assertEqual(animal_key("A  Cat "), "cat", "Article, case and spaces dropped")
+        self.assertEqual(animal_key("the cat"), animal_key("an cat"), "Any article")
+        self.assertEqual(animal_key("An"), "an", "A name that is only an article is kept")
+        self.assertEqual(animal_key("a tabby cat"), "tabby cat", "Only the first word can be an article")
+        self.assertEqual(animal_key(u"A Caf\u00c9 Owl"), u"caf\u00e9 owl", "Accents are lower-cased too")
+
+        index = self.learned_tree().index
+        self.assertTrue(index.animal("The Frog") is index.animal("a  frog"), "Found by key")
+
+    def test_similar_animal(self):
+        index = self.learned_tree().index
+        self.assertEqual(index.similar_animal("a garter snaek").text, "a garter snake", "Letters swapped")
+        self.assertEqual(index.similar_animal("dogs").text, "a dog", "Plural")
+        self.assertEqual(index.similar_animal("a cta").text, "a cat", "Short name, letters swapped")
+        self.assertEqual(index.similar_animal("The Cat").text, "a cat", "Same key")
+        self.assertTrue(index.similar_animal("a komodo") is None, "Too short to be the dragon")
+        self.assertTrue(index.similar_animal("an elephant") is None, "Nothing like it")
+
+        # * Animals added or taken away since are matched, or not
+
+        root_node = index.animal("a frog").parent.parent.parent
+        root_node.add_clue("nny", "a frog", "has a trunk", "an elephant")
+        self.assertEqual(index.similar_animal("elephants").text, "an elephant", "New animal matched")
+        index.remove(index.animal("a raven"))
+        self.assertTrue(index.similar_animal("a ravem") is None, "Animal gone")
+
+        # * Only names with enough letter pairs in common are compared
+
+        self.assertEqual(index._near("rattlesnake"), [], "Four pairs shared with the snake: not enough")
+        self.assertEqual(index._near("garter snaek"), ["garter snake"], "Only the snake is close")
+
+class TestNodeTable(GuessimalTestCase):
+
+    def test_round_trip(self):
+        root_node = self.learned_tree()
+        table = NodeTable(NodeTable.dumps(root_node))
+
+        self.assertEqual(table.count, len(root_node.index), "One record per node")
+        self.assertEqual(_shape(table.to_tree()), _shape(root_node), "Tree should come back the same")
+
+        self.assertRaises(ValueError, NodeTable, b"GSML")
+        self.assertRaises(ValueError, NodeTable, b"XXXX" + NodeTable.dumps(root_node)[4:])
+        self.assertRaises(ValueError, NodeTable, NodeTable.dumps(root_node)[:20])
+
+    def test_open(self):
+        root_node = self.learned_tree()
+        root_node.save_tree(self.data_file)
+
+        self.assertTrue(NodeTable.is_table(self.data_file), "Saved as a table")
+        loaded = Node.load_tree(self.data_file)
+        self.assertEqual(_shape(loaded), _shape(root_node), "Tree should load the same")
+        self.assertTrue(loaded.index.animal("a frog") is not None, "Loaded tree is indexed")
+
+    def test_table_node(self):
+        root_node = self.learned_tree()
+        root_node.save_tree(self.data_file)
+        table_root = NodeTable.open(self.data_file).table_node()
+
+        self.assertEqual(_shape(table_root), _shape(root_node), "Table walks like the tree")
+        self.assertEqual(table_root.get_child('n').get_child('y').text, "a raven", "Children by answer")
+        self.assertTrue(table_root.get_child('x') is None, "Only 'y' and 'n' children")
+        self.assertTrue(table_root.get_child('n').get_child('y').get_child('y') is None, "Leaves have no children")
+
+        oracle = {"has four legs": 'y', "is a house pet": True, "purrs": "Yes"}
+        self.assertEqual(classify(table_root, [oracle])[0].text, "a cat", "Classify works on tables")
+
+    def test_migrate(self):
+        data_file = open(self.data_file, "wb")
+        data_file.write(OLD_DATA)
+        data_file.close()
+
+        root_node = Node.load_tree(self.data_file)
+        self.assertEqual(_shape(root_node),
+                         [("has four legs", False), ("a cat", True), ("has wings", False),
+                          ("a raven", True), ("a garter snake", True)],
+                         "Pickled tree should load")
+        self.assertTrue(NodeTable.is_table(self.data_file), "Data file should be a table now")
+        self.assertEqual(open(self.data_file + ".pickle", "rb").read(), OLD_DATA, "Pickle should be kept")
+        self.assertEqual(_shape(Node.load_tree(self.data_file)), _shape(root_node), "Table should match")
+
+    def test_play_from_table(self):
+        self.learned_tree().save_tree(self.data_file)
+
+        # * Guessing right plays from the table, without reading the tree in
+
+        game = Guessimal(self.data_file)
+        self.script(['y', 'y', 'y', 'y'])
+        game.process_node(game.start_node())
+        self.assertTrue(game._root_node is None, "Tree should not be read in")
+
+        # * Learning reads it in, and logs the animal
+
+        game.path = []
+        self.script(['n', 'n', 'n', 'n', 'y', 'y'], ["a lizard", "is scaly"])
+        game.process_node(game.start_node())
+        self.assertTrue(game._root_node is not None, "Tree should be read in to learn")
+        self.assertEqual(TreeIndex.path(game.root_node.index.animal("a lizard")), "nnny",
+                         "Animal learned where the player was")
+        self.assertEqual(game.journal.count, 1, "Animal logged")
+
+        # * With animals in the journal, a new game reads the tree in
+
+        self.assertTrue(Guessimal(self.data_file)._root_node is not None, "Journal needs replaying")
+
+
+class TestTreeJournal(GuessimalTestCase):
+
+    def setUp(self):
+        GuessimalTestCase.setUp(self)
+        self.journal = TreeJournal(self.data_file + ".log")
+
+    def test_records(self):
+        self.assertEqual(self.journal.records(), [], "No log yet")
+
+        self.journal.append("yy", "a dog", "purrs", "a cat")
+        self.journal.append("n", u"a caf\u00e9 owl", u"says \u201choo\u201d", "an owl")
+        self.assertEqual(self.journal.count, 2, "Two records appended")
+
+        self.assertEqual(TreeJournal(self.journal.file_name).records(),
+                         [("yy", "a dog", "purrs", "a cat"),
+                          ("n", u"a caf\u00e9 owl", u"says \u201choo\u201d", "an owl")],
+                         "Records should read back as written")
+
+    def test_replay(self):
+        root_node = self.learned_tree()
+        self.journal.append("nnn", "a garter snake", "is scaly", "a lizard")
+        self.journal.append("yyn", "a dog", "barks", "a wolf")
+
+        replayed = self.journal.replay(self.learned_tree())
+        self.assertEqual(TreeIndex.path(replayed.index.animal("a lizard")), "nnny", "Animal replayed")
+
+        # * Replaying over a tree that already has the records changes nothing
+
+        again = self.journal.replay(replayed)
+        self.assertEqual(_shape(again), _shape(replayed), "Replay should be idempotent")
+        self.assertEqual(len(again.index), len(root_node.index) + 4, "Two animals, two clues, once each")
+
+    def test_torn_tail(self):
+        self.journal.append("yy", "a dog", "purrs", "a cat")
+        self.journal.append("n", "a raven", "hoots", "an owl")
+        whole = os.path.getsize(self.journal.file_name)
+
+        # * A crash part way through writing a record
+
+        log_file = open(self.journal.file_name, "ab")
+        log_file.write(TreeJournal.RECORD.pack(40, 0) + b"a half")
+        log_file.close()
+
+        self.assertEqual(len(self.journal.records()), 2, "Whole records should be kept")
+        self.assertEqual(os.path.getsize(self.journal.file_name), whole, "Torn tail should be cut off")
+
+        # * A damaged record and everything after it are dropped
+
+        log_file = open(self.journal.file_name, "r+b")
+        log_file.seek(TreeJournal.RECORD.size + 1)
+        log_file.write(b"X")
+        log_file.close()
+        self.assertEqual(self.journal.records(), [], "Bad checksum should stop the replay")
+
+        # * Records appended after the cut are not lost behind it
+
+        self.journal.append("yy", "a dog", "purrs", "a cat")
+        self.assertEqual(len(self.journal.records()), 1, "New record should be read")
+
+    def test_clear(self):
+        game = Guessimal(self.data_file)
+        game.learn("yy", "a dog", "purrs", "a cat")
+        self.assertEqual(len(Guessimal(self.data_file).journal.records()), 1, "Animal logged, not saved")
+
+        game.save()
+        self.assertEqual(game.journal.records(), [], "Saving clears the log")
+        self.assertTrue(Guessimal(self.data_file).root_node.index.animal("a cat") is not None,
+                        "Animal in the saved tree")
+
+    def test_save_synced(self):
+        game = Guessimal(self.data_file)
+        game.learn("yy", "a dog", "purrs", "a cat")
+
+        # * The new data file is on disk, and renamed into place, before
+        # * the log is cleared
+
+        events = []
+        fsync, rename, clear = os.fsync, os.rename, TreeJournal.clear
+        self.addCleanup(setattr, os, "fsync", fsync)
+        self.addCleanup(setattr, os, "rename", rename)
+        self.addCleanup(setattr, TreeJournal, "clear", clear)
+        os.fsync = lambda fd: events.append("fsync") or fsync(fd)
+        os.rename = lambda old, new: events.append("rename") or rename(old, new)
+        TreeJournal.clear = lambda journal: events.append("clear") or clear(journal)
+
+        game.save()
+        self.assertEqual(events[:2], ["fsync", "rename"], "Data file synced before it's swapped in")
+        self.assertEqual(events[-1], "clear", "Log cleared last")
+        self.assertTrue(events.count("fsync") >= 2, "Directory synced after the rename")
+
+
+
+def _chain(animals):
+    """A tree that asks about each animal in turn, as if learned one by one"""
+    root_node = node = Node("is animal 0")
+    for number in range(animals - 1):
+        Node("animal %d" % number, node, 'y')
+        if number < animals - 2:
+            node = Node("is animal %d" % (number + 1), node, 'n')
+        else:
+            Node("animal %d" % (number + 1), node, 'n')
+    return root_node
+
+def _bit_answers(animals):
+    """Known answers to clues that tell the chain's animals apart by halves"""
+    bits = max(animals - 1, 1).bit_length()
+    return dict(("animal %d" % number,
+                 dict(("has bit %d" % bit, "y" if number >> bit & 1 else "n") for bit in range(bits)))
+                for number in range(animals))
+
+class TestOptimizer(GuessimalTestCase):
+
+    def test_path_only(self):
+        root_node = self.learned_tree()
+        new_root, report = optimize_tree(root_node)
+        self.assertEqual(_shape(new_root), _shape(root_node), "Nothing to gain from the tree's own answers")
+        self.assertEqual(report["average_after"], report["average_before"], "Same questions")
+
+        # * A long chain is rebuilt without looking at every path again
+
+        root_node = _chain(3000)
+        new_root, report = optimize_tree(root_node)
+        self.assertEqual(_shape(new_root), _shape(root_node), "Chain should be kept")
+        self.assertEqual(report["animals"], 3000, "Every animal counted")
+
+    def test_known_answers(self):
+        known = _bit_answers(64)
+        known["Animal 3 "] = {"Has bit 7": "y"} # the same animal and clue, by key
+        new_root, report = optimize_tree(_chain(64), known)
+        self.assertEqual(report["worst_after"], 6, "Halving should take six questions")
+        self.assertTrue(report["average_after"] < report["average_before"], "Better on average")
+
+        # * Every animal is still found, with its own answers
+
+        oracles = []
+        for number in range(64):
+            answers = dict(("is animal %d" % other, other == number) for other in range(64))
+            answers.update(known["animal %d" % number])
+            oracles.append(answers)
+        self.assertEqual([leaf.text for leaf in classify(new_root, oracles)],
+                         ["animal %d" % number for number in range(64)], "Each animal should be found")
+
+    def test_repeated_clue(self):
+        root_node = Node("is big")
+        again = Node("is big", root_node, 'y')
+        Node("an elephant", again, 'y')
+        Node("a mouse", again, 'n') # answered yes already, so never reached
+        Node("an ant", root_node, 'n')
+
+        new_root, report = optimize_tree(root_node, {"a mouse": {"squeaks": "y"}, "an elephant": {"squeaks": False}})
+        self.assertEqual(sorted(node.text for node in new_root.walk() if node.is_leaf()),
+                         ["a mouse", "an ant", "an elephant"], "No animal should be left out")
+
+    def test_save(self):
+        self.script([])
+        _chain(16).save_tree(self.data_file)
+        game = Guessimal(self.data_file)
+        game.learn("n" * 15, "animal 15", "is a bird", "a bird")
+        answers_file = os.path.join(self.directory, "answers.json")
+        with open(self.data_file, "rb") as data_file:
+            saved = data_file.read()
+
+        # * No better, so neither the tree nor the journal is touched
+
+        with open(answers_file, "w") as answers:
+            answers.write("{}")
+        optimize_and_save(answers_file, self.data_file)
+        with open(self.data_file, "rb") as data_file:
+            self.assertEqual(data_file.read(), saved, "Tree should be left alone")
+        self.assertEqual(len(game.journal.records()), 1, "Journal should be kept")
+
+        # * Better, so it's saved, bird and all
+
+        known = _bit_answers(16)
+        known["a bird"] = dict((clue_text, "n") for clue_text in known["animal 0"])
+        known["a bird"]["has bit 4"] = "y"
+        with open(answers_file, "w") as answers:
+            json.dump(known, answers)
+        optimize_and_save(answers_file, self.data_file)
+        game = Guessimal(self.data_file)
+        self.assertEqual(game.journal.records(), [], "Saved, so the journal starts again")
+        self.assertEqual(len([node for node in game.root_node.walk() if node.is_leaf()]), 17,
+                         "Every animal should be kept")
+        self.assertEqual(question_counts(game.root_node)[1], 5, "Halving should take five questions")
+
 
 if __name__ == "__main__":
-    play_and_save()
+    if sys.argv[1:2] == ["optimize"]:
+        if len(sys.argv) != 3:
+            print("Usage: %s optimize ANSWERS.json" % sys.argv[0])
+            print("The answers are {animal: {clue: \"y\" or \"n\"}}: the tree's own answers")
+            print("alone can't do any better than the tree already does.")
+            sys.exit(2)
+        optimize_and_save(sys.argv[2])
+    elif sys.argv[1:] == ["test"]:
+        unittest.main(argv=sys.argv[:1])
+    elif sys.argv[1:2] == ["explain"]:
+        Guessimal().explain(" ".join(sys.argv[2:]))
+    else:
+        play_and_save()
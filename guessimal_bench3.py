@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Benchmark building, saving, loading and playing guessimal trees
+
+Synthetic trees of any size are built in one of three shapes: balanced,
+a chain (as learning from one stubborn player makes), or grown by random
+learning. Each phase is timed, the process's memory high-water mark is
+reported after it, and optionally each phase's own peak (tracemalloc)
+and a cProfile of it are taken. Games are played both on the tree read
+in as Nodes ("play") and straight from the saved table ("table").
+
+python3 guessimal_bench3.py --nodes 100000 1000000 --shape balanced random
+python3 guessimal_bench3.py --compare    (slotted Node against dict nodes)
+"""
+
+import argparse
+import cProfile
+import contextlib
+import io
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import guessimal
+from guessimal import Node, TreeIndex
+
+class DictNode:
+    """The previous Node: attributes and children in dicts"""
+
+    def __init__(self, my_text, parent_node=None, parent_answer=None):
+        self.text = my_text
+        self.children = {}
+        if parent_node and parent_answer:
+            parent_node.set_child(self, parent_answer)
+
+    def set_child(self, child_node, my_answer):
+        self.children[my_answer] = child_node
+
+###
+# Synthetic trees. Like a tree read from a file, every node gets its own
+# copy of its text, though there are only a thousand different texts.
+
+def _text(number):
+    return "".join(("thing ", str(number % 1000)))
+
+def balanced_tree(count, rng, node_class=Node):
+    """A complete binary tree of count nodes (one less if count is even,
+    so every clue has both answers)"""
+    count = max(count - 1 + count % 2, 1)
+    nodes = [node_class(_text(n)) for n in range(count)]
+    for number in range(1, count):
+        nodes[(number - 1) // 2].set_child(nodes[number], 'y' if number % 2 else 'n')
+    return nodes[0]
+
+def chain_tree(count, rng):
+    """Every clue has an animal on its "y" side and the next clue on its
+    "n" side, as when each new animal is learned at the last leaf. The
+    last clue has an animal on both sides."""
+    clues = max((count - 1) // 2, 1)
+    root_node = clue = Node(_text(0))
+    for number in range(1, clues):
+        Node(_text(number), clue, 'y')
+        clue = Node(_text(number), clue, 'n')
+    Node(_text(clues), clue, 'y')
+    Node(_text(clues + 1), clue, 'n')
+    return root_node
+
+def random_tree(count, rng):
+    """Learn animals at leaves picked at random, as add_clue does"""
+    root_node = Node(_text(0))
+    leaves = [root_node]
+    while 2 * len(leaves) - 1 < count:
+        leaf = rng.choice(leaves)
+        number = len(leaves)
+        root_node = root_node.add_clue(TreeIndex.path(leaf), leaf.text, _text(number), _text(number))
+        leaves.append(leaf.parent.get_child('y'))
+    return root_node
+
+SHAPES = {"balanced": balanced_tree, "chain": chain_tree, "random": random_tree}
+
+###
+# Phases
+
+def play(game, leaves):
+    """Play one scripted game for each leaf, answering the way to it"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        for leaf in leaves:
+            answers = iter(list(TreeIndex.path(leaf)) + ['y'])
+            guessimal.input_yes_no = lambda prompt_text: next(answers)
+            game.path = []
+            game.process_node(game.start_node())
+
+def load(data_file):
+    """Read the whole tree in as Nodes"""
+    game = guessimal.Guessimal(data_file)
+    game.root_node
+    return game
+
+def run_phase(name, options, label, function, *args):
+    """Run one phase, reporting its time and memory, and profiling it if
+    asked. Returns what the function returns."""
+    if options.trace_memory:
+        tracemalloc.start()
+    profile = cProfile.Profile() if options.profile else None
+
+    start = time.perf_counter()
+    if profile:
+        result = profile.runcall(function, *args)
+    else:
+        result = function(*args)
+    seconds = time.perf_counter() - start
+
+    report = "{:28} {:6} {:9.3f} s  high-water {:7.1f} MB".format(
+        label, name, seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+    if options.trace_memory:
+        report += "  phase peak {:7.1f} MB".format(tracemalloc.get_traced_memory()[1] / 2.0 ** 20)
+        tracemalloc.stop()
+    print(report)
+
+    if profile:
+        profile_file = os.path.join(options.profile, "{}-{}.prof".format(label.replace(" ", "-"), name))
+        profile.dump_stats(profile_file)
+
+    return result
+
+def bench(options):
+    work_dir = tempfile.mkdtemp()
+    saved_input = guessimal.input_yes_no
+    try:
+        for shape in options.shape:
+            for count in options.nodes:
+                rng = random.Random(options.seed)
+                label = "{} {:,} nodes".format(shape, count)
+                data_file = os.path.join(work_dir, "bench.data")
+
+                root_node = run_phase("build", options, label, SHAPES[shape], count, rng)
+                run_phase("save", options, label, root_node.save_tree, data_file)
+                del root_node
+
+                game = run_phase("load", options, label, load, data_file)
+
+                leaves = [node for node in game.root_node.walk() if node.is_leaf()]
+                leaves = [rng.choice(leaves) for game_number in range(options.plays)]
+                run_phase("play", options, label, play, game, leaves)
+                del game
+
+                # played straight from the memory-mapped table
+                game = guessimal.Guessimal(data_file)
+                run_phase("table", options, label, play, game, leaves)
+                del game, leaves
+    finally:
+        guessimal.input_yes_no = saved_input
+        shutil.rmtree(work_dir)
+
+def compare(options):
+    """Bytes per node held by balanced trees of slotted and dict nodes"""
+    for count in options.nodes:
+        for node_class in (DictNode, Node):
+            tracemalloc.start()
+            root_node = balanced_tree(count, None, node_class)
+            held = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del root_node
+            print("{:>9,} nodes {:9} {:7.1f} bytes/node".format(count, node_class.__name__, held / count))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10 ** 5], help="tree sizes")
+    parser.add_argument("--shape", nargs="+", choices=sorted(SHAPES), default=sorted(SHAPES))
+    parser.add_argument("--plays", type=int, default=100, help="scripted games per tree")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true", help="also report each phase's own peak")
+    parser.add_argument("--profile", metavar="DIR", help="write a cProfile of each phase here")
+    parser.add_argument("--compare", action="store_true", help="compare memory against dict nodes")
+    options = parser.parse_args()
+
+    if options.profile and not os.path.isdir(options.profile):
+        os.makedirs(options.profile)
+
+    if options.compare:
+        compare(options)
+    else:
+        bench(options)
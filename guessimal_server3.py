@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""Serve guessimal to many players at once, sharing what it learns
+
+Every session plays against the same tree in memory. Sessions only read
+the tree; new animals are queued to a single writer task, which logs
+them to the journal and adds them to the tree one at a time, and saves
+the whole tree after a batch of them or a quiet spell. So no player's
+animal is lost to another's, however many play at once.
+
+python3 guessimal_server3.py [port]
+
+then play with, for instance, "nc localhost 4242"
+"""
+
+import asyncio
+import sys
+
+from guessimal import Guessimal, tidy_text
+
+class GuessimalServer:
+    """The shared tree, its writer, and the player sessions"""
+
+    # save the tree this long after the last animal learned, if the
+    # journal hasn't filled up first
+    SAVE_AFTER = 30.0
+
+    def __init__(self, file_name="guessimal.data"):
+        self.game = Guessimal(file_name)
+        self.port = None # once serving: the one picked, if asked for port 0
+        self._learned = None # made once the event loop is running
+
+
+    async def serve(self, host="127.0.0.1", port=4242):
+        """Accept players until cancelled, then save what was learned"""
+        self._learned = asyncio.Queue()
+        writer_task = asyncio.ensure_future(self._write())
+        server = await asyncio.start_server(self._session, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        try:
+            await server.serve_forever()
+        finally:
+            server.close()
+            await self._learned.join()
+            writer_task.cancel()
+            if self.game.journal.count:
+                self.game.save()
+
+
+    def known_animal(self, animal_text, declined=None):
+        """The leaf for the animal, or for one whose name is close to it
+        (other than one the player has said they didn't mean), or None"""
+        index = self.game.root_node.index
+        known = index.animal(animal_text)
+        if known is None:
+            known = index.similar_animal(animal_text)
+            if known is not None and known is index.animal(declined or ""):
+                known = None
+        return known
+
+
+    async def learn(self, path, leaf_text, clue_text, animal_text, declined=None):
+        """Queue a new animal for the writer, returning once it's in the
+        tree: None, or the leaf of the animal if another player taught it
+        (or one close to it) first"""
+        done = asyncio.get_running_loop().create_future()
+        await self._learned.put((path, leaf_text, clue_text, animal_text, declined, done))
+        return await done
+
+
+    async def _write(self):
+        """The only task that changes the tree or touches the files"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                timeout = GuessimalServer.SAVE_AFTER if self.game.journal.count else None
+                learned = await asyncio.wait_for(self._learned.get(), timeout)
+            except asyncio.TimeoutError:
+                await loop.run_in_executor(None, self.game.save)
+                continue
+
+            path, leaf_text, clue_text, animal_text, declined, done = learned
+            known = self.known_animal(animal_text, declined)
+            if known is not None:
+                # another player taught it first
+                done.set_result(known)
+                self._learned.task_done()
+                continue
+            try:
+                # log it first (that waits on the disk, so off the event
+                # loop), then add it; add_clue copes with paths that
+                # other players' animals have since grown
+                await loop.run_in_executor(None, self.game.journal.append,
+                                           path, leaf_text, clue_text, animal_text)
+                self.game.root_node = self.game.root_node.add_clue(path, leaf_text, clue_text, animal_text)
+                if self.game.journal.count >= Guessimal.SAVE_EVERY:
+                    await loop.run_in_executor(None, self.game.save)
+                done.set_result(None)
+            except Exception as err:
+                done.set_exception(err)
+            finally:
+                self._learned.task_done()
+
+
+    async def _session(self, reader, writer):
+        """Play games with one connected player until they leave"""
+        session = Session(self, reader, writer)
+        try:
+            while True:
+                await session.play()
+                if await session.ask_yes_no("Play again?") != 'y':
+                    break
+        except (EOFError, ConnectionError):
+            pass # player went away
+        finally:
+            writer.close()
+
+
+class Session:
+    """One player's side of the game, as lines of text over a socket"""
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+
+
+    async def say(self, text):
+        self.writer.write(text.encode("utf-8"))
+        await self.writer.drain()
+
+
+    async def ask_text(self, prompt_text):
+        """Ask for a line of text, tidied; EOFError when they hang up"""
+        await self.say(prompt_text)
+        line = await self.reader.readline()
+        if not line:
+            raise EOFError
+        return tidy_text(line.decode("utf-8", "replace"))
+
+
+    async def ask_yes_no(self, prompt_text):
+        """Ask until the answer starts with Y or N, returning 'y' or 'n'"""
+        while True:
+            reply = (await self.ask_text(prompt_text + " (Y/N) ")).lower()
+            if reply[:1] in ('y', 'n'):
+                return reply[0]
+
+
+    async def play(self):
+        """One game, as Guessimal.process_node plays it"""
+        current_node = self.server.game.root_node
+        path = []
+        while not current_node.is_leaf():
+            user_response = await self.ask_yes_no("Your animal " + current_node.text + "?")
+            next_node = current_node.get_child(user_response)
+            if next_node is None:
+                continue
+            path.append(user_response)
+            current_node = next_node
+
+        user_response = await self.ask_yes_no("Is your animal " + current_node.text + "?")
+        if user_response != 'n':
+            await self.say("I am very clever! YAY ME!\n")
+            return
+
+        await self.say("OK, you stumped me. Tell me the animal you were thinking of so I can learn it.\n"
+                       'Be sure to add "a" or "an" in front of the animal\'s name, like "a giraffe"\n')
+
+        animal_reply = 'n'
+        while animal_reply != 'y':
+            animal_text = await self.ask_text("Your animal is: ")
+            animal_reply = await self.ask_yes_no("Your animal is " + animal_text + ", is this OK?")
+
+        # learning an animal again would leave two leaves for it, so check
+        # for it (or a typo of one) as Guessimal.process_node does
+        index = self.server.game.root_node.index
+        known = index.animal(animal_text)
+        declined = None
+        if known is None:
+            similar = index.similar_animal(animal_text)
+            if similar is not None:
+                if await self.ask_yes_no("Did you mean " + similar.text + "?") == 'y':
+                    known = similar
+                else:
+                    declined = similar.text
+        if known is not None:
+            await self.say("But I already know %s!\n" % known.text)
+            return
+
+        await self.say("Teach me what makes %s different from %s\nPlease finish this clue:\n"
+                       % (animal_text, current_node.text))
+
+        clue_reply = 'n'
+        while clue_reply != 'y':
+            clue_text = await self.ask_text(animal_text + " ")
+            clue_reply = await self.ask_yes_no("The clue is: %s %s, is this OK?" % (animal_text, clue_text))
+
+        known = await self.server.learn("".join(path), current_node.text, clue_text, animal_text, declined)
+        if known is not None:
+            await self.say("Someone has just taught me %s!\n" % known.text)
+            return
+        await self.say("Thanks! I'll remember that for next time.\n")
+
+###
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from guessimal import NodeTable, animal_key
+
+class TestGuessimalServer(unittest.TestCase):
+    """Players over real sockets, against a server on a free port"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.directory, "guessimal.data")
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.server = GuessimalServer(self.data_file)
+
+    async def start(self):
+        serving = asyncio.ensure_future(self.server.serve(port=0))
+        while self.server.port is None:
+            await asyncio.sleep(0.01)
+        return serving
+
+    async def stop(self, serving):
+        serving.cancel()
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+
+    async def player(self, answers):
+        """Send a player's lines, and return everything they were told"""
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.server.port)
+        writer.write("".join(answer + "\n" for answer in answers).encode("utf-8"))
+        await writer.drain()
+        told = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+        return told.decode("utf-8")
+
+    def animals(self, root_node):
+        return sorted(animal_key(node.text) for node in root_node.walk() if node.is_leaf())
+
+    def test_sessions(self):
+        async def play():
+            serving = await self.start()
+            told = await asyncio.gather(
+                self.player(["y", "y", "n", "a cat", "y", "purrs", "y", "n"]),
+                self.player(["n", "y", "n", "an owl", "y", "hoots", "y", "n"]))
+            learned = self.animals(self.server.game.root_node)
+            await self.stop(serving)
+            return told, learned
+
+        told, learned = asyncio.run(play())
+
+        # * Both players' animals are learned
+
+        for each in told:
+            self.assertIn("I'll remember that", each, "Animal should be learned")
+        self.assertIn("cat", learned, "First player's animal")
+        self.assertIn("owl", learned, "Second player's animal")
+
+        # * Stopping the server saves the journal into the table
+
+        self.assertEqual(self.server.game.journal.records(), [], "Journal saved")
+        self.assertTrue(NodeTable.is_table(self.data_file), "Tree saved as a table")
+        self.assertEqual(self.animals(NodeTable.open(self.data_file).table_node()), learned,
+                         "Saved tree should have both animals")
+
+    def test_taught_twice(self):
+        async def play():
+            serving = await self.start()
+
+            # * Two players teach the same animal at once
+
+            told = await asyncio.gather(
+                self.player(["y", "y", "n", "a cat", "y", "purrs", "y", "n"]),
+                self.player(["y", "y", "n", "a cat", "y", "meows", "y", "n"]))
+
+            # * Or one close to it, from the same spot in the tree
+
+            known = await asyncio.gather(
+                self.server.learn("yyn", "a dog", "barks", "a wolf"),
+                self.server.learn("yyn", "a dog", "howls", "a wlof"),
+                self.server.learn("yyn", "a dog", "is tiny", "a wolff", declined="a wolf"))
+
+            # * A player who meant an animal already known is told so
+
+            told.append(await self.player(["y", "y", "y", "n", "a cta", "y", "y", "n"]))
+            learned = self.animals(self.server.game.root_node)
+            await self.stop(serving)
+            return told, known, learned
+
+        told, known, learned = asyncio.run(play())
+        self.assertEqual(learned.count("cat"), 1, "Cat should be learned once")
+        self.assertEqual([leaf and leaf.text for leaf in known], [None, "a wolf", None],
+                         "Only the animal not declined should be added")
+        self.assertEqual(learned.count("wolf"), 1, "Wolf should be learned once")
+        self.assertIn("wolff", learned, "Declined match should not stop the animal")
+        self.assertIn("Did you mean a cat?", told[2], "Typo should be caught")
+        self.assertNotIn("cta", learned, "Typo should not be learned")
+
+    def test_batched_save(self):
+        saved = GuessimalServer.SAVE_AFTER
+        self.addCleanup(setattr, GuessimalServer, "SAVE_AFTER", saved)
+        GuessimalServer.SAVE_AFTER = 0.05
+
+        async def play():
+            serving = await self.start()
+            await self.player(["y", "y", "n", "a cat", "y", "purrs", "y", "n"])
+            for wait in range(200):
+                if not self.server.game.journal.count:
+                    break
+                await asyncio.sleep(0.01)
+            journal = self.server.game.journal.records()
+            table = self.animals(NodeTable.open(self.data_file).table_node())
+            await self.stop(serving)
+            return journal, table
+
+        journal, table = asyncio.run(play())
+
+        # * A quiet spell after an animal is learned saves it, while
+        # * the server carries on
+
+        self.assertEqual(journal, [], "Journal saved after a quiet spell")
+        self.assertIn("cat", table, "Saved tree should have the animal")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["test"]:
+        unittest.main(argv=sys.argv[:1])
+    else:
+        server = GuessimalServer()
+        try:
+            asyncio.run(server.serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else 4242))
+        except KeyboardInterrupt:
+            pass
@@ -1,6 +1,11 @@
 #!/usr/bin/env python
 
+import multiprocessing
 import random
+import sys
+import time
+
+from streams import Stream
 
 ### HiHo - A cherry of a kid's game
 
@@ -27,9 +32,12 @@ class Spinner:
     # Instead of an instance, the class itself is passed in as a parameter
     # by the calling code
     #
+    # Any random.Random (like a streams.Stream) can be passed in to make
+    # the spins repeatable
+    #
     @classmethod
-    def spin(classname):
-        return random.choice(classname._values)
+    def spin(classname, rng=random):
+        return rng.choice(classname._values)
 
 
 class Player:
@@ -41,8 +49,9 @@ class Player:
         self.cherries = 0
 
 
-    def take_turn(self,spin_result):
-        print "%s spins %s" % (self.get_name(),spin_result[0])
+    def take_turn(self,spin_result,announce=True):
+        if announce:
+            print "%s spins %s" % (self.get_name(),spin_result[0])
         self.cherries += spin_result[1]
         if (self.cherries < 0):
             self.cherries = 0
@@ -53,33 +62,227 @@ class Player:
     def get_name(self):
         return self.name
 
-### Main program
-
-players = []
-
-print "Enter player names, youngest to oldest, one per line. Enter an empty name when complete."
-
-while (1): # No do...while loop in Python, so break on the end case
-    player_name = raw_input()
-    if (len(player_name)):
-        players.append(Player(player_name))
-        print " Welcome, " + player_name
-    else:
-        break
-
-if (len(players) < 2):
-    print "Not enough players, goodbye"
-    exit
+### Playing a game, with or without anyone watching
 
-else:
+def play_game(players, rng=random, announce=False):
+    """Take turns until someone wins, returning the winner's seat number
+    (0 is the first player) and how many turns were taken"""
     player_number = 0
+    turns = 0
     while (1):
         current_player = players[player_number]
-        current_player.take_turn(Spinner.spin())
+        current_player.take_turn(Spinner.spin(rng), announce)
+        turns += 1
         if (current_player.is_winner()):
-            print current_player.get_name() + " is the winner!"
-            break
+            if announce:
+                print current_player.get_name() + " is the winner!"
+            return player_number, turns
         player_number = (player_number + 1) % len(players)
-        if (0 == player_number):
+        if (announce and 0 == player_number):
             print # put a blank line between each round
 
+### Lots of games at once, to work out the odds
+
+def play_games(seats, games, rng):
+    """Play games without printing, counting the wins by seat and the
+    number of games of each length (in turns)"""
+    wins = [0] * seats
+    lengths = {}
+    for game in xrange(games):
+        players = [Player(str(seat)) for seat in range(seats)]
+        winner, turns = play_game(players, rng)
+        wins[winner] += 1
+        lengths[turns] = lengths.get(turns, 0) + 1
+    return wins, lengths
+
+def _play_games(args):
+    # Pool.map only hands over a single argument
+    return play_games(*args)
+
+def simulate(seats, games, seed=None, workers=None):
+    """Split the games across worker processes, each with its own random
+    stream, and add up the results. Returns a dictionary with the seed,
+    wins by seat, game lengths, and the time taken"""
+    if seats < 1:
+        raise ValueError("Need at least one player")
+    if games < 1:
+        raise ValueError("Need at least one game")
+    workers = workers or multiprocessing.cpu_count()
+    rng = Stream(seed)
+
+    shares = [games // workers + (1 if worker < games % workers else 0)
+              for worker in range(workers)]
+    jobs = [(seats, share, stream)
+            for share, stream in zip(shares, rng.split(workers)) if share]
+
+    started = time.time()
+    pool = multiprocessing.Pool(len(jobs))
+    try:
+        results = pool.map(_play_games, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    seconds = time.time() - started
+
+    wins = [0] * seats
+    lengths = {}
+    for shard_wins, shard_lengths in results:
+        for seat in range(seats):
+            wins[seat] += shard_wins[seat]
+        for turns, count in shard_lengths.items():
+            lengths[turns] = lengths.get(turns, 0) + count
+
+    return {"seed": rng.root_seed, "games": games, "wins": wins,
+            "lengths": lengths, "seconds": seconds}
+
+### Working out the odds exactly
+#
+# Each player's bucket changes only on their own spins, so one player's
+# cherry count is a Markov chain over 0..10 (10 meaning "won"). Knowing
+# the chance that a player has won within k spins, the chance that a
+# seat wins on round k is the chance it wins on exactly its k-th spin
+# while the seats before it haven't won in k spins, and the seats
+# after it haven't won in k-1.
+
+WINNING_CHERRIES = 10
+
+def transitions():
+    """Build the transition matrix for one player's bucket from the
+    spinner values: transitions()[now][after] is the chance of going
+    from one cherry count to the other in a single spin"""
+    chance = 1.0 / len(Spinner._values)
+    matrix = [[0.0] * (WINNING_CHERRIES + 1) for _ in range(WINNING_CHERRIES + 1)]
+    for cherries in range(WINNING_CHERRIES):
+        for text, change in Spinner._values:
+            after = min(max(cherries + change, 0), WINNING_CHERRIES)
+            matrix[cherries][after] += chance
+    matrix[WINNING_CHERRIES][WINNING_CHERRIES] = 1.0 # a winner stays won
+    return matrix
+
+def solve(seats, tolerance=1e-12):
+    """Work out the exact odds for a number of players, stopping once
+    the chance of the game still going is below the tolerance. Returns
+    a dictionary shaped like simulate(), with chances for counts"""
+    if seats < 1:
+        raise ValueError("Need at least one player") # or it never stops
+    started = time.time()
+    matrix = transitions()
+    states = range(WINNING_CHERRIES + 1)
+
+    buckets = [1.0] + [0.0] * WINNING_CHERRIES  # everyone starts empty
+    won_before = 0.0                            # won within k-1 spins
+    wins = [0.0] * seats
+    lengths = {}
+
+    spins = 0
+    while (1 - won_before) ** seats > tolerance:
+        spins += 1
+        buckets = [sum(buckets[now] * matrix[now][after] for now in states)
+                   for after in states]
+        won_by = buckets[WINNING_CHERRIES]
+        won_now = won_by - won_before
+
+        for seat in range(seats):
+            chance = won_now * (1 - won_by) ** seat * (1 - won_before) ** (seats - 1 - seat)
+            wins[seat] += chance
+            if chance:
+                lengths[(spins - 1) * seats + seat + 1] = chance
+
+        won_before = won_by
+
+    return {"seed": None, "games": 1.0, "wins": wins,
+            "lengths": lengths, "seconds": time.time() - started}
+
+###
+
+def report(results):
+    """Print the odds from a simulate() or solve() run"""
+    games = results["games"]
+    if results["seed"] is None:
+        print "Exact odds, worked out in %.4f seconds" % results["seconds"]
+    else:
+        print "%d games in %.2f seconds (%d games/second), seed %d" % (
+            games, results["seconds"], games / max(results["seconds"], 1e-9), results["seed"])
+    print
+    for seat, wins in enumerate(results["wins"]):
+        print "Seat %d wins %6.2f%%" % (seat + 1, 100.0 * wins / games)
+    print
+
+    lengths = results["lengths"]
+    average = sum(turns * count for turns, count in lengths.items()) / float(games)
+    print "Average game: %.1f turns" % average
+    seen = 0
+    for turns in sorted(lengths):
+        seen += lengths[turns]
+        print "%4d turns %6.2f%% %s" % (turns, 100.0 * lengths[turns] / games,
+                                        "#" * int(200.0 * lengths[turns] / games))
+        if seen >= 0.99 * games:
+            if results["seed"] is not None:
+                print "(longest game: %d turns)" % max(lengths)
+            break
+
+###
+
+import unittest
+
+class TestOdds(unittest.TestCase):
+
+    def test_solve(self):
+        for seats in (1, 2, 4):
+            results = solve(seats)
+            self.assertAlmostEqual(sum(results["wins"]), 1.0, 9, "Someone should win")
+            self.assertAlmostEqual(sum(results["lengths"].values()), 1.0, 9, "Every game ends")
+        self.assertTrue(results["wins"][0] > results["wins"][3], "Going first helps")
+
+    def test_simulate(self):
+        exact = solve(2)
+        results = simulate(2, 20000, seed=1234, workers=2)
+        self.assertEqual(sum(results["wins"]), 20000, "Every game won by someone")
+        self.assertEqual(results["wins"], simulate(2, 20000, seed=1234, workers=2)["wins"],
+                         "Same seed should play the same games")
+        for seat in range(2):
+            self.assertAlmostEqual(results["wins"][seat] / 20000.0, exact["wins"][seat], delta=0.02,
+                                   msg="Simulated odds should be near the exact ones")
+
+    def test_too_few(self):
+        self.assertRaises(ValueError, solve, 0)
+        self.assertRaises(ValueError, simulate, 0, 100)
+        self.assertRaises(ValueError, simulate, 2, 0)
+
+### Main program
+
+def play_interactive():
+    players = []
+
+    print "Enter player names, youngest to oldest, one per line. Enter an empty name when complete."
+
+    while (1): # No do...while loop in Python, so break on the end case
+        player_name = raw_input()
+        if (len(player_name)):
+            players.append(Player(player_name))
+            print " Welcome, " + player_name
+        else:
+            break
+
+    if (len(players) < 2):
+        print "Not enough players, goodbye"
+
+    else:
+        play_game(players, announce=True)
+
+if __name__ == "__main__":
+    # hiho2.py simulate PLAYERS GAMES [SEED] estimates the odds instead,
+    # hiho2.py solve PLAYERS works them out exactly, and hiho2.py test
+    # checks the two against each other
+    try:
+        if len(sys.argv) > 3 and sys.argv[1] == "simulate":
+            seed = int(sys.argv[4]) if len(sys.argv) > 4 else None
+            report(simulate(int(sys.argv[2]), int(sys.argv[3]), seed))
+        elif len(sys.argv) > 2 and sys.argv[1] == "solve":
+            report(solve(int(sys.argv[2])))
+        elif sys.argv[1:] == ["test"]:
+            unittest.main(argv=sys.argv[:1])
+        else:
+            play_interactive()
+    except ValueError as error:
+        sys.exit(error)
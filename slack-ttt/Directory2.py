@@ -0,0 +1,114 @@
+#!/usr/bin/env python2
+"""Slack users of a team, looked up by name"""
+
+import httplib
+import json
+import sys
+import threading
+import time
+import urllib
+
+from User2 import User
+
+###
+
+class Directory:
+    """A team's users by name, fetched page by page with Slack's
+    users.list and kept for TTL seconds
+
+    Lookups only wait on Slack the first time, or when the name isn't
+    known and the users are a while old (someone may just have joined).
+    Once the users are older than the TTL, they are still used while a
+    background thread fetches them again.
+    """
+
+    TTL       = 15 * 60 # seconds before fetching the users again
+    RECHECK   = 60      # seconds before an unknown name fetches them again
+    PAGE_SIZE = 200     # users asked for in each users.list call
+
+    def __init__(self, token, host = "slack.com", port = None, https = True, ttl = None):
+        self.token = token
+        self.host  = host
+        self.port  = port
+        self.https = https
+        self.ttl   = Directory.TTL if ttl is None else ttl
+
+        self._by_name   = {}
+        self._loaded_at = None # time of the last fetch, if any worked
+        self._lock      = threading.Lock() # one fetch at a time
+        self._refresh   = None # the background fetch, while running
+        self._refresh_lock = threading.Lock()
+
+    def lookup(self, name):
+        """The User with the given @-name (no @), or None"""
+        if self._loaded_at is None:
+            self.fetch()
+        elif name not in self._by_name and time.time() - self._loaded_at > Directory.RECHECK:
+            self.fetch()
+        elif time.time() - self._loaded_at > self.ttl:
+            self._start_refresh()
+        return self._by_name.get(name)
+
+    def fetch(self):
+        """Fetch every page of users, then swap them in all at once,
+        unless another thread did while this one waited for its turn"""
+        loaded_at = self._loaded_at
+        with self._lock:
+            if self._loaded_at != loaded_at:
+                return # fetched meanwhile
+            by_name = {}
+            cursor = ""
+            while True:
+                page = self._call("users.list", limit = Directory.PAGE_SIZE, cursor = cursor)
+                if not page.get("ok"):
+                    return # keep whatever users we have
+                for member in page.get("members", []):
+                    by_name[member["name"]] = User(user_id = member["id"], user_name = member["name"])
+                cursor = page.get("response_metadata", {}).get("next_cursor", "")
+                if not cursor:
+                    break
+            self._by_name   = by_name
+            self._loaded_at = time.time()
+
+    def _start_refresh(self):
+        with self._refresh_lock:
+            if self._refresh is not None and self._refresh.is_alive():
+                return
+            self._refresh = threading.Thread(target = self._refresh_users)
+            self._refresh.daemon = True
+            self._refresh.start()
+
+    def _refresh_users(self):
+        try:
+            self.fetch()
+        except Exception as error:
+            sys.stderr.write("Could not fetch Slack users: {}\n".format(error))
+
+    def _call(self, method, **args):
+        """POST to a Slack API method, returning its decoded reply"""
+        args["token"] = self.token
+        query = urllib.urlencode(args)
+        headers = {"Content-type": "application/x-www-form-urlencoded",
+                   "Accept": "application/json"}
+        if self.https:
+            connect = httplib.HTTPSConnection(self.host, self.port, timeout = 10)
+        else:
+            connect = httplib.HTTPConnection(self.host, self.port, timeout = 10)
+        try:
+            connect.request("POST", "/api/" + method, query, headers)
+            return json.loads(connect.getresponse().read())
+        finally:
+            connect.close()
+
+###
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+def team_directory(team_id, token, **options):
+    """The one directory for the team in this process, made the first
+    time it's asked for. Options are passed to Directory."""
+    with _directories_lock:
+        if team_id not in _directories:
+            _directories[team_id] = Directory(token, **options)
+        return _directories[team_id]
@@ -0,0 +1,312 @@
+#!/usr/bin/env python2
+"""Where saved games are kept: in memory, files, SQLite or MongoDB"""
+
+import atexit
+import collections
+import itertools
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+try:
+    import pymongo
+    from bson.binary import Binary
+except:
+    # Only needed for MongoDB storage
+    pass
+
+### custom storage exceptions
+
+class ConflictError(Exception):
+    """The game was saved by someone else since it was loaded"""
+    pass
+
+###
+
+class Storage:
+    """Saved game records by team and channel. Subclasses keep them
+    somewhere."""
+
+    def get(self, team_id, channel_id):
+        """Return the record saved for the channel, or None"""
+        raise NotImplementedError
+
+    def put(self, team_id, channel_id, data):
+        """Save a record for the channel, replacing any before it"""
+        raise NotImplementedError
+
+    def get_versioned(self, team_id, channel_id):
+        """Return the record and its version, to pass to put_versioned.
+        Storage that doesn't keep versions gives None."""
+        return self.get(team_id, channel_id), None
+
+    def put_versioned(self, team_id, channel_id, data, version):
+        """Save a record, if it's still at the version it was read at
+        (raising ConflictError if not), and return its new version.
+        A version of None saves the record whatever."""
+        self.put(team_id, channel_id, data)
+        return None
+
+###
+
+class MemoryStorage(Storage):
+    """Records in a dict: for tests, and for games that needn't last"""
+
+    def __init__(self):
+        self._saves = {}
+
+    def get(self, team_id, channel_id):
+        return self._saves.get((team_id, channel_id))
+
+    def put(self, team_id, channel_id, data):
+        self._saves[(team_id, channel_id)] = bytes(data)
+
+
+class FileStorage(Storage):
+    """One ttt-<team>-<channel>.save file per channel"""
+
+    def __init__(self, directory = "."):
+        self.directory = directory
+
+    def _filename(self, team_id, channel_id):
+        return os.path.join(self.directory, "ttt-{}-{}.save".format(team_id, channel_id))
+
+    def get(self, team_id, channel_id):
+        try:
+            data_file = open(self._filename(team_id, channel_id), "rb")
+        except IOError:
+            return None
+        try:
+            return data_file.read()
+        finally:
+            data_file.close()
+
+    def put(self, team_id, channel_id, data):
+        data_file = open(self._filename(team_id, channel_id), "wb")
+        try:
+            data_file.write(data)
+        finally:
+            data_file.close()
+
+
+class SQLiteStorage(Storage):
+    """Records in a table of an SQLite database file. One connection is
+    shared by every request in the process."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread = False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS ttt_saves (
+                                team_id    TEXT,
+                                channel_id TEXT,
+                                game_data  BLOB,
+                                PRIMARY KEY (team_id, channel_id))""")
+        self._db.commit()
+
+    def get(self, team_id, channel_id):
+        with self._lock:
+            row = self._db.execute("SELECT game_data FROM ttt_saves WHERE team_id = ? AND channel_id = ?",
+                                   ("%s" % team_id, "%s" % channel_id)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def put(self, team_id, channel_id, data):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO ttt_saves VALUES (?, ?, ?)",
+                             ("%s" % team_id, "%s" % channel_id, sqlite3.Binary(data)))
+            self._db.commit()
+
+
+class MongoStorage(Storage):
+    """Records in the ttt_saves collection of the URI's default database
+
+    A MongoClient keeps its own pool of connections, and is safe to share
+    between threads, so there is one client per URI for the whole
+    process rather than one (and a new handshake) per game.
+    """
+
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, uri, client = None):
+        """Use the process's client for the URI, or the client given"""
+        if client is None:
+            with MongoStorage._clients_lock:
+                client = MongoStorage._clients.get(uri)
+                if client is None:
+                    client = MongoStorage._clients[uri] = pymongo.MongoClient(uri)
+        self._saves = client.get_default_database()["ttt_saves"]
+
+    def get(self, team_id, channel_id):
+        saved = self._saves.find_one({'team_id'    : team_id,
+                                      'channel_id' : channel_id})
+        if saved and "game_data" in saved:
+            return bytes(saved["game_data"])
+        return None
+
+    def put(self, team_id, channel_id, data):
+        self._saves.update_one({'team_id'    : team_id,
+                                'channel_id' : channel_id},
+                               {'$set' : {'game_data' : Binary(data)}},
+                               upsert = True)
+
+###
+
+class CachedStorage(Storage):
+    """Recently used games kept in memory, in front of other storage
+
+    Reads of a cached channel don't touch the storage behind, and saves
+    are written behind: kept in memory straight away and written out by
+    a background thread shortly after, so a busy channel's moves don't
+    each wait on the database. Each cached record has a version, new
+    with every save and every read from storage (never one handed out
+    before, even for a game forgotten and read in again), so a game
+    saved from a stale copy raises ConflictError rather than quietly
+    undoing the other save.
+
+    Reading from the storage behind doesn't hold up other games: only
+    requests for the same game wait for it.
+
+    The cache is per process, and its versions are only in memory: with
+    more than one process sharing the storage behind, they can't see each
+    other's saves, so only use it with a single process.
+    """
+
+    def __init__(self, storage, size = 1000, delay = 0.5):
+        """Cache up to size channels, writing saves out after delay seconds"""
+        self.storage = storage
+        self.size = size
+        self.delay = delay
+
+        self._lock = threading.Lock()
+        self._loaded = threading.Condition(self._lock) # a game was read in
+        self._flush_lock = threading.Lock()
+        self._games = collections.OrderedDict() # key: [data, version], least recently used first
+        self._dirty = collections.OrderedDict() # key: data not yet written out
+        self._loading = set() # keys being read from the storage behind
+        self._versions = itertools.count(1)
+
+        self._wake = threading.Event()
+        self._writer = threading.Thread(target = self._write_behind)
+        self._writer.daemon = True
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _entry(self, team_id, channel_id):
+        """The cached [data, version], reading it in if need be. Called
+        with the lock held, which is let go while the storage is read."""
+        key = (team_id, channel_id)
+        while key not in self._games:
+            if key in self._loading:
+                self._loaded.wait() # someone else is reading it in
+                continue
+            self._loading.add(key)
+            self._lock.release()
+            try:
+                data = self.storage.get(team_id, channel_id)
+            finally:
+                self._lock.acquire()
+                self._loading.discard(key)
+                self._loaded.notify_all()
+            self._games[key] = [data, next(self._versions)]
+        entry = self._games.pop(key)
+        self._games[key] = entry # now the most recently used
+
+        # Forget the least recently used games, but not ones still to
+        # be written out: the cache can run over until they are
+        while len(self._games) > self.size:
+            for old_key in self._games:
+                if old_key not in self._dirty and old_key != key:
+                    del self._games[old_key]
+                    break
+            else:
+                break
+
+        return entry
+
+    def get(self, team_id, channel_id):
+        return self.get_versioned(team_id, channel_id)[0]
+
+    def put(self, team_id, channel_id, data):
+        self.put_versioned(team_id, channel_id, data, None)
+
+    def get_versioned(self, team_id, channel_id):
+        with self._lock:
+            data, version = self._entry(team_id, channel_id)
+            return data, version
+
+    def put_versioned(self, team_id, channel_id, data, version):
+        with self._lock:
+            entry = self._entry(team_id, channel_id)
+            if version is not None and version != entry[1]:
+                raise ConflictError
+            entry[0] = bytes(data)
+            entry[1] = next(self._versions)
+            self._dirty[(team_id, channel_id)] = entry[0]
+            self._wake.set()
+            return entry[1]
+
+    def flush(self):
+        """Write out every save still waiting"""
+        # One flush at a time, so an older save can't be written over a
+        # newer one, but games can still be read and saved meanwhile. A
+        # save stays in _dirty until it's written, so its game can't be
+        # forgotten and read back from storage before then
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._dirty:
+                        return
+                    key, data = next(iter(self._dirty.items()))
+                self.storage.put(key[0], key[1], data)
+                with self._lock:
+                    if self._dirty.get(key) is data: # not saved again since
+                        del self._dirty[key]
+
+    def _write_behind(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            time.sleep(self.delay) # gather up a few saves
+            try:
+                self.flush()
+            except Exception as error:
+                sys.stderr.write("Could not save games, will retry: {}\n".format(error))
+                self._wake.set()
+
+###
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def open_storage(url):
+    """Make the storage a URL describes:
+
+    memory:          records in this process only
+    file:DIRECTORY   a file per channel (file: alone is the current directory)
+    sqlite:PATH      an SQLite database file
+    mongodb://...    MongoDB
+    """
+    if url == "memory:":
+        return MemoryStorage()
+    if url.startswith("file:"):
+        return FileStorage(url[len("file:"):] or ".")
+    if url.startswith("sqlite:"):
+        return SQLiteStorage(url[len("sqlite:"):])
+    if url.startswith("mongodb://") or url.startswith("mongodb+srv://"):
+        return MongoStorage(url)
+    raise ValueError("Unknown storage: " + url)
+
+def shared_storage(url, cache_size = 0):
+    """The one storage for the URL in this process, made the first time
+    it's asked for, so every request reuses its connections. With a
+    cache_size, recently used games are cached in front of it."""
+    with _shared_lock:
+        key = (url, cache_size)
+        if key not in _shared:
+            storage = open_storage(url)
+            if cache_size:
+                storage = CachedStorage(storage, cache_size)
+            _shared[key] = storage
+        return _shared[key]
@@ -1,13 +1,11 @@
 #!/usr/bin/env python2
 """Tic-Tac-Toe game implementation for two players, using a text display"""
 
-import pickle
+import pickle # to read games saved before the compact records
+import struct
 
-try:
-    import pymongo
-except:
-    # If not present, class will save in local pickled ttt*.save files
-    pass
+from Storage2 import shared_storage, ConflictError
+from User2 import User
 
 ### custom in-game exceptions
 
@@ -20,6 +18,60 @@ class InvalidLocationError(Exception):
 class InvalidUserError(Exception):
     pass
 
+### bitboard tables
+
+def _win_masks(winners):
+    """A bitmask of the positions in each winning combination"""
+    return [sum(1 << (position - 1) for position in winner) for winner in winners]
+
+def _cell_wins(masks):
+    """For each of the nine cells, the winning masks that include it"""
+    return [tuple(mask for mask in masks if mask & (1 << cell)) for cell in range(9)]
+
+### saved game records
+#
+# A record is the magic bytes and a version, then the two bitboards and
+# a byte of flags, then each player: None, a number, text, or a User's
+# id and name, each behind a one-byte tag
+
+RECORD_MAGIC   = b"TTT"
+RECORD_VERSION = 1
+RECORD_HEADER  = struct.Struct("<3sBHHB") # magic, version, X bits, O bits, flags
+
+TAG_NONE, TAG_INT, TAG_TEXT, TAG_LONG_TEXT, TAG_USER = range(5)
+
+def _pack_value(value):
+    """One tagged id or name"""
+    if value is None:
+        return struct.pack("<B", TAG_NONE)
+    if isinstance(value, User):
+        return struct.pack("<B", TAG_USER) + _pack_value(value.id) + _pack_value(value.name)
+    if isinstance(value, int) or type(value).__name__ == "long":
+        return struct.pack("<Bq", TAG_INT, value)
+    text = value.encode("utf-8") if not isinstance(value, bytes) else value
+    if len(text) < 256:
+        return struct.pack("<BB", TAG_TEXT, len(text)) + text
+    return struct.pack("<BH", TAG_LONG_TEXT, len(text)) + text
+
+def _unpack_value(data, offset):
+    """Read one tagged value, returning it and the offset after it"""
+    tag, = struct.unpack_from("<B", data, offset)
+    offset += 1
+    if tag == TAG_NONE:
+        return None, offset
+    if tag == TAG_INT:
+        return struct.unpack_from("<q", data, offset)[0], offset + 8
+    if tag in (TAG_TEXT, TAG_LONG_TEXT):
+        size = "<B" if tag == TAG_TEXT else "<H"
+        length, = struct.unpack_from(size, data, offset)
+        offset += struct.calcsize(size)
+        return data[offset:offset + length].decode("utf-8"), offset + length
+    if tag == TAG_USER:
+        user_id, offset = _unpack_value(data, offset)
+        user_name, offset = _unpack_value(data, offset)
+        return User(user_id = user_id, user_name = user_name), offset
+    raise ValueError("Unknown tag in saved game")
+
 ###
 
 class TTT:
@@ -32,13 +84,39 @@ class TTT:
                (1,4,7), (2,5,8), (3,6,9),  # verticals
                (1,5,9), (3,5,7)]           # diagonals
 
+    # The board is kept as two bitboards, one each for X and O: bit n-1
+    # is set when the player has position n. The winning combinations
+    # become masks, listed by each position they include, so checking a
+    # move only needs a few integer operations
+    #
+    FULL_BOARD = (1 << 9) - 1
+
+    WIN_MASKS = _win_masks(WINNERS)
+
+    CELL_WINS = _cell_wins(WIN_MASKS)
+
     # Cloud storage: insert URL here to use
     #
     MONGODB_URI = ''
 
+    # Or pick any storage by URL (see Storage2.open_storage), such as
+    # "sqlite:ttt.db". With neither, games are saved in local
+    # ttt*.save files
+    #
+    STORAGE_URL = ''
+
+    # Set to cache this many recently played games in memory, saving
+    # them to storage shortly after (see Storage2.CachedStorage). Only
+    # for a server running as a single process: with more than one
+    # sharing the storage, leave at 0 so every load and save goes
+    # straight to storage
+    #
+    CACHE_SIZE = 0
+
     ###
-    def __init__(self, channel, player_X, player_O):
-        """Set up a new game in the channel"""
+    def __init__(self, channel, player_X, player_O, storage = None):
+        """Set up a new game in the channel, kept in the given storage
+        (by default, the shared storage)"""
 
         self.channel = channel
         self.player_X = player_X
@@ -46,12 +124,17 @@ class TTT:
         self.next_turn = player_X
         self.game_over = False
         self.winner = None
-        self._moves = [None] * 9
+        self._x_bits = 0
+        self._o_bits = 0
+
+        self._storage = storage if storage is not None else TTT.shared_storage()
+        self._version = None # as loaded from storage, to catch clashing saves
 
-        try:
-            self._storage = pymongo.MongoClient(TTT.MONGODB_URI)
-        except:
-            self._storage = None
+    ###
+    @staticmethod
+    def shared_storage():
+        """The process-wide storage for the configured URL"""
+        return shared_storage(TTT.STORAGE_URL or TTT.MONGODB_URI or "file:", TTT.CACHE_SIZE)
 
     ###
     def get_board(self, show_labels = False):
@@ -64,22 +147,32 @@ class TTT:
  {6} | {7} | {8}
 """
 
-        # The self._moves list contains some blend of None, "X", and "O"
-        # in its nine indices, corresponding to the formatted string of
-        # the board. How None is handled is controlled by the show_labels
-        # parameter: either a number is shown for user input, or a blank
-        # is shown for general in-channel display
+        # Each of the nine spaces is "X", "O", or empty, corresponding
+        # to the formatted string of the board. How empty spaces are
+        # handled is controlled by the show_labels parameter: either a
+        # number is shown for user input, or a blank is shown for
+        # general in-channel display
         #
         # If there's an X or O in the space already, that always
         # takes precedence
         #
         if show_labels:
-            moves = [ self._moves[n] or (n + 1) for n in range(9) ]
+            moves = [ self.symbol_at(n + 1) or (n + 1) for n in range(9) ]
         else:
-            moves = [ self._moves[n] or " "     for n in range(9) ]
+            moves = [ self.symbol_at(n + 1) or " "     for n in range(9) ]
 
         return board.format(*moves)
 
+    ###
+    def symbol_at(self, location):
+        """Return "X" or "O" for the player at the given location (1-9), or None"""
+        bit = 1 << (location - 1)
+        if self._x_bits & bit:
+            return "X"
+        if self._o_bits & bit:
+            return "O"
+        return None
+
     ###
     def play_at(self, player, location):
         """Put the player's symbol at the given location (1-9)"""
@@ -90,34 +183,35 @@ class TTT:
         if self.next_turn != player:
             raise NotYourTurnError
 
-        if self._moves[location-1] is not None:
+        if not 1 <= location <= 9:
             raise InvalidLocationError
 
+        bit = 1 << (location - 1)
+        if (self._x_bits | self._o_bits) & bit:
+            raise InvalidLocationError
+
+        # Mark the board with the player's symbol
+
         if self.player_X == player:
-            symbol = "X"
+            self._x_bits |= bit
+            marks = self._x_bits
             self.next_turn = self.player_O
         else:
-            symbol = "O"
+            self._o_bits |= bit
+            marks = self._o_bits
             self.next_turn = self.player_X
 
-
-        # Mark the board with the player's symbol
-
-        self._moves[location-1] = symbol
-
         # Check for an end-game situation
 
-        if None not in self._moves:
+        if self._x_bits | self._o_bits == TTT.FULL_BOARD:
             self.game_over = True
 
         # Check only the three-in-a-row combinations that contain the
-        # move just made: if all three of those cells on the board
-        # contain the just-played symbol, then it's a win for the
-        # current player
+        # move just made: if the player holds every position in one of
+        # them, then it's a win for the current player
 
-        possibles = filter(lambda t: location in t, TTT.WINNERS)
-        for possible in possibles:
-            if symbol == self._moves[possible[0]-1] == self._moves[possible[1]-1] == self._moves[possible[2]-1]:
+        for mask in TTT.CELL_WINS[location - 1]:
+            if marks & mask == mask:
                 self.game_over = True
                 self.next_turn = None
                 self.winner    = player
@@ -130,53 +224,72 @@ class TTT:
         self.save()
 
     ###
-    def save(self):
-        """Put the state of the game in storage, by channel"""
+    def to_record(self):
+        """Return the state of the game as a compact record"""
 
-        save_obj = TTT(None, None, None)
-        save_obj.__dict__ = self.__dict__.copy()
-        save_obj._storage = None
+        # Turn and winner are kept as which player they are: 0 for none,
+        # 1 for X, 2 for O
+        def which(player):
+            if player is None:
+                return 0
+            return 1 if player is self.player_X or player == self.player_X else 2
 
-        if self._storage:
+        flags = int(self.game_over) | which(self.next_turn) << 1 | which(self.winner) << 3
 
-            db = self._storage.get_default_database()
-            saves = db["ttt_saves"]
-
-            saves.update_one({'team_id'    : self.channel.team_id,
-                              'channel_id' : self.channel.channel_id},
-                             {'$set' : {'game_data' : pickle.dumps(save_obj,0)}},
-                             upsert = True)
-
-        else:
-            filename = "ttt-{}-{}.save".format(self.channel.team_id, self.channel.channel_id)
-            data_file = open(filename, "w")
-            data_file.write(pickle.dumps(self))
-            data_file.flush()
+        return b"".join((RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION,
+                                            self._x_bits, self._o_bits, flags),
+                         _pack_value(self.player_X),
+                         _pack_value(self.player_O)))
 
     ###
-    def load(self):
-        """Fetch the state of the game from storage by channel"""
+    def load_record(self, data):
+        """Set the state of the game from a record, or from a pickled
+        game saved by an older version"""
+
+        if data[:len(RECORD_MAGIC)] != RECORD_MAGIC:
+            storage = self._storage
+            self.__dict__ = pickle.loads(data).__dict__.copy()
+            self._storage = storage
+            self._upgrade_board()
+            return
+
+        magic, version, x_bits, o_bits, flags = RECORD_HEADER.unpack_from(data, 0)
+        if version != RECORD_VERSION:
+            raise ValueError("Saved game is from a newer version")
+
+        self.player_X, offset = _unpack_value(data, RECORD_HEADER.size)
+        self.player_O, offset = _unpack_value(data, offset)
+
+        players = (None, self.player_X, self.player_O)
+        self._x_bits = x_bits
+        self._o_bits = o_bits
+        self.game_over = bool(flags & 1)
+        self.next_turn = players[flags >> 1 & 3]
+        self.winner = players[flags >> 3 & 3]
 
-        if self._storage:
-
-            storage = self._storage # for restorating after the unpickled load
-
-            db = self._storage.get_default_database()
-            saves = db["ttt_saves"]
+    ###
+    def save(self):
+        """Put the state of the game in storage, by channel. Raises
+        ConflictError if the game was loaded, and someone else has saved
+        it since."""
 
-            unpickler = lambda d : pickle.loads(d)
+        self._version = self._storage.put_versioned(self.channel.team_id, self.channel.channel_id,
+                                                    self.to_record(), self._version)
 
-            saved = saves.find({'team_id': self.channel.team_id,
-                                'channel_id': self.channel.channel_id});
+    ###
+    def load(self):
+        """Fetch the state of the game from storage by channel, if any
+        was saved"""
 
-            for s in saved:
-                if "game_data" in s.keys():
-                    loaded = pickle.loads(s["game_data"])
-                    self.__dict__ = loaded.__dict__.copy()
-                    self._storage = storage
+        data, version = self._storage.get_versioned(self.channel.team_id, self.channel.channel_id)
+        if data is not None:
+            self.load_record(data)
+        self._version = version
 
-        else:
-            filename = "ttt-{}-{}.save".format(self.channel.team_id, self.channel.channel_id)
-            data_file = open(filename, "rb")
-            loaded = pickle.load(data_file)
-            self.__dict__ = loaded.__dict__.copy()
+    ###
+    def _upgrade_board(self):
+        """Games saved before the bitboards kept a list of "X", "O" and None"""
+        moves = self.__dict__.pop("_moves", None)
+        if moves is not None:
+            self._x_bits = sum(1 << n for n in range(9) if moves[n] == "X")
+            self._o_bits = sum(1 << n for n in range(9) if moves[n] == "O")
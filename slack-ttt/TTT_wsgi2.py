@@ -4,13 +4,13 @@
 import cgi
 import json
 import httplib
-import urllib
 
 from flask import Response
 
-from TTT2  import TTT, NotYourTurnError, InvalidLocationError, InvalidUserError
+from TTT2  import TTT, NotYourTurnError, InvalidLocationError, InvalidUserError, ConflictError
 from User2 import User
 from Channel2 import Channel
+from Directory2 import team_directory
 
 ###
 
@@ -21,6 +21,12 @@ class Slack_TTT():
     APP_TOKEN  = ''
     AUTH_TOKEN = ''
 
+    # Where to find the Slack API
+    #
+    SLACK_HOST  = 'slack.com'
+    SLACK_PORT  = None
+    SLACK_HTTPS = True
+
     def __init__(self,request):
         self.form = request.form
         self.token = self.form.get("token", default=None)
@@ -32,7 +38,7 @@ class Slack_TTT():
         self.user = User(user_id = request.form.get("user_id"),
                          user_name = request.form.get("user_name"))
 
-        self.users = None  # filled in later by init_users()
+        self.users = None  # the team's Directory, set by init_users()
         self.output = {}
 
     #
@@ -133,23 +139,19 @@ quit : drop out of any game you're in
             # Look up the challenged user id, given their @-name
             self.init_users()
 
-            opponent = None
-
-            if len(self.users):
-                opponent = filter(lambda u: u.name == username, self.users)
-                if len(opponent):
-                    opponent = opponent[0] # because filter() returns a list
-
-                    if opponent == self.user:
-                        self.output["text"] = "Sorry, this is a two-player game\nTry: /ttt @someone"
-                    else:
-                        # start a game
-                        ttt = TTT(channel = self.channel,
-                                  player_X = self.user,
-                                  player_O = opponent)
-                        ttt.save()
-                        self.output["text"] = "Started a game with @{}\n```{}```".format(username, ttt.get_board(show_labels=True))
-                        attach["text"] = """
+            opponent = self.users.lookup(username)
+
+            if opponent is not None:
+                if opponent == self.user:
+                    self.output["text"] = "Sorry, this is a two-player game\nTry: /ttt @someone"
+                else:
+                    # start a game
+                    ttt = TTT(channel = self.channel,
+                              player_X = self.user,
+                              player_O = opponent)
+                    ttt.save()
+                    self.output["text"] = "Started a game with @{}\n```{}```".format(username, ttt.get_board(show_labels=True))
+                    attach["text"] = """
 Type /ttt [1-9] to play
 You are playing "X"
 @{} is playing "O" """.format(username)
@@ -178,6 +180,8 @@ You are playing "X"
         except InvalidLocationError:
             self.output["text"] = "That space is taken, try another\n```{}```".format(ttt.get_board(show_labels=True))
             attach["text"] = "To make a move, type:\n/ttt [1-9]"
+        except ConflictError:
+            self.output["text"] = "Someone else just moved, take another look: /ttt show"
         else:
             self.output["response_type"] = "in_channel"
             if ttt.game_over:
@@ -203,13 +207,17 @@ You are playing "X"
 
         if not ttt.game_over:
             if self.user in (ttt.player_X, ttt.player_O):
-                self.output["response_type"] = "in_channel"
-                self.output["text"] = "@{} is a quitter!".format(self.user.name)
                 ttt.game_over = True
                 ttt.winner    = None
-                ttt.save()
-                self.output["text"] += "```{}```\nGAME OVER".format(ttt.get_board())
-                attach["text"] = "Try: /ttt @someone for a new game"
+                try:
+                    ttt.save()
+                except ConflictError:
+                    self.output["text"] = "Someone else just moved, take another look: /ttt show"
+                else:
+                    self.output["response_type"] = "in_channel"
+                    self.output["text"] = "@{} is a quitter!".format(self.user.name)
+                    self.output["text"] += "```{}```\nGAME OVER".format(ttt.get_board())
+                    attach["text"] = "Try: /ttt @someone for a new game"
             else:
                 self.output["text"] = "Only @{} or @{} can quit the current game".format(ttt.player_X.name, ttt.player_O.name)
         else:
@@ -266,19 +274,11 @@ N != U? {}""".format(ttt.next_turn.id, ttt.next_turn.name,
     ### HELPERS
 
     def init_users(self):
-        query = urllib.urlencode({ "token" : Slack_TTT.AUTH_TOKEN })
-        headers = {"Content-type": "application/x-www-form-urlencoded",
-                   "Accept": "text/plain"}
-        connect = httplib.HTTPSConnection("slack.com")
-        connect.request("POST","/api/users.list",query,headers)
-        response = connect.getresponse()
-        raw_users = json.loads(response.read())
-
-        self.users = []
-
-        if raw_users["ok"]:
-            for member in raw_users["members"]:
-                self.users.append(User(user_id = member["id"], user_name = member["name"]))
+        """Find the team's users, kept between requests"""
+        self.users = team_directory(self.channel.team_id, Slack_TTT.AUTH_TOKEN,
+                                    host  = Slack_TTT.SLACK_HOST,
+                                    port  = Slack_TTT.SLACK_PORT,
+                                    https = Slack_TTT.SLACK_HTTPS)
 
 ###
 
@@ -0,0 +1,190 @@
+#!/usr/bin/env python2
+"""Test cases for the Slack user directory, against a stub Slack"""
+
+import BaseHTTPServer
+import json
+import threading
+import unittest
+import urlparse
+
+import Directory2
+from Directory2 import Directory, team_directory
+
+###
+
+MEMBERS = [{"id" : "AB128", "name" : "ted"},
+           {"id" : "CD256", "name" : "alice"},
+           {"id" : "EF512", "name" : "bob"},
+           {"id" : "GH024", "name" : "carol"},
+           {"id" : "IJ048", "name" : "dave"}]
+
+class StubSlack(BaseHTTPServer.HTTPServer):
+    """Answers users.list a page at a time, keeping the calls made"""
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), StubHandler)
+        self.members = list(MEMBERS)
+        self.calls = []
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers.getheader("Content-Length"))
+        args = dict(urlparse.parse_qsl(self.rfile.read(length)))
+        self.server.calls.append((self.path, args))
+
+        if args.get("token") != "xoxb-test":
+            reply = {"ok" : False, "error" : "invalid_auth"}
+        else:
+            start = int(args.get("cursor") or 0)
+            end = start + int(args["limit"])
+            reply = {"ok" : True,
+                     "members" : self.server.members[start:end],
+                     "response_metadata" : {"next_cursor" : str(end) if end < len(self.server.members) else ""}}
+
+        body = json.dumps(reply)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass # keep the test output quiet
+
+###
+
+class Test_Directory(unittest.TestCase):
+
+    def setUp(self):
+        self.slack = StubSlack()
+        self.serving = threading.Thread(target = self.slack.serve_forever)
+        self.serving.daemon = True
+        self.serving.start()
+
+        self.saved_page_size = Directory.PAGE_SIZE
+        Directory.PAGE_SIZE = 2
+
+    def tearDown(self):
+        self.slack.shutdown()
+        self.slack.server_close()
+
+        Directory.PAGE_SIZE = self.saved_page_size
+        Directory2._directories.clear()
+
+    def directory(self, token = "xoxb-test", **options):
+        return Directory(token, host = "127.0.0.1", port = self.slack.server_port,
+                         https = False, **options)
+
+    ### EVERY PAGE OF USERS
+    ###
+    ###
+    def test_pages(self):
+
+        directory = self.directory()
+
+        # * All five users are found, two to a page
+
+        for member in MEMBERS:
+            user = directory.lookup(member["name"])
+            self.assertEqual(user.id, member["id"],
+                             "User should be found by name")
+        self.assertEqual([path for path, args in self.slack.calls], ["/api/users.list"] * 3,
+                         "Users should be fetched in three pages")
+        self.assertEqual([args.get("cursor", "") for path, args in self.slack.calls], ["", "2", "4"],
+                         "Each page should follow the last one's cursor")
+
+    ### NO ROUND TRIP WHILE FRESH
+    ###
+    ###
+    def test_cache(self):
+
+        directory = self.directory()
+        directory.lookup("ted")
+        calls = len(self.slack.calls)
+
+        # * Known and unknown names alike are answered from memory
+
+        self.assertEqual(directory.lookup("alice").name, "alice",
+                         "Alice should be known")
+        self.assertTrue(directory.lookup("mallory") is None,
+                        "Mallory is not in the team")
+        self.assertEqual(len(self.slack.calls), calls,
+                         "Fresh users should not be fetched again")
+
+        # * Someone who joins is found once the users are a while old
+
+        self.slack.members.append({"id" : "KL096", "name" : "erin"})
+        directory._loaded_at -= Directory.RECHECK + 1
+        self.assertEqual(directory.lookup("erin").id, "KL096",
+                         "New user should be fetched")
+
+        # * One team's directory is shared between requests
+
+        self.assertTrue(team_directory(926, "xoxb-test") is team_directory(926, "xoxb-test"),
+                        "Directory for a team should be shared")
+
+    ### MANY LOOKUPS AT ONCE, ONE FETCH
+    ###
+    ###
+    def test_cold_start(self):
+
+        directory = self.directory()
+        found = []
+        lookups = [threading.Thread(target = lambda: found.append(directory.lookup("carol")))
+                   for lookup in range(5)]
+        for lookup in lookups:
+            lookup.start()
+        for lookup in lookups:
+            lookup.join(5)
+
+        # * Lookups waiting on the first fetch use its users
+
+        self.assertEqual([user.id for user in found], ["GH024"] * 5,
+                         "Every lookup should find the user")
+        self.assertEqual(len(self.slack.calls), 3,
+                         "Users should be fetched once")
+
+    ### STALE USERS ARE REFRESHED BEHIND
+    ###
+    ###
+    def test_ttl(self):
+
+        directory = self.directory(ttl = 0)
+        directory.lookup("ted")
+        calls = len(self.slack.calls)
+
+        # * Past the TTL, the old users answer while new ones are fetched
+
+        self.slack.members[0] = {"id" : "AB128", "name" : "teddy"}
+        self.assertEqual(directory.lookup("ted").id, "AB128",
+                         "Stale users should still answer")
+        directory._refresh.join(5)
+
+        self.assertEqual(len(self.slack.calls), calls + 3,
+                         "Users should be fetched again")
+        self.assertTrue(directory.lookup("ted") is None,
+                        "Renamed user should be gone")
+        directory._refresh.join(5)
+        self.assertEqual(directory.lookup("teddy").id, "AB128",
+                         "Renamed user should be found")
+        directory._refresh.join(5)
+
+    ### SLACK SAYS NO
+    ###
+    ###
+    def test_failed(self):
+
+        directory = self.directory(token = "wrong")
+        self.assertTrue(directory.lookup("ted") is None,
+                        "No users without a good token")
+        self.assertTrue(directory.lookup("ted") is None,
+                        "Still no users")
+        self.assertEqual(len(self.slack.calls), 2,
+                         "Failed fetches should be tried again")
+
+#
+
+if __name__ == '__main__':
+    unittest.main()
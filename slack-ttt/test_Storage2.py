@@ -0,0 +1,343 @@
+#!/usr/bin/env python2
+"""Test cases for the storage backends"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import Storage2
+from Storage2 import (MemoryStorage, FileStorage, SQLiteStorage, MongoStorage,
+                      CachedStorage, ConflictError, open_storage, shared_storage)
+from TTT2     import TTT
+from User2    import User
+from Channel2 import Channel
+
+###
+
+class FakeCollection:
+    """Just enough of a pymongo collection"""
+
+    def __init__(self):
+        self.documents = []
+
+    def find_one(self, query):
+        for document in self.documents:
+            if all(document.get(k) == v for k, v in query.items()):
+                return document
+        return None
+
+    def update_one(self, query, update, upsert = False):
+        document = self.find_one(query)
+        if document is None and upsert:
+            document = dict(query)
+            self.documents.append(document)
+        document.update(update['$set'])
+
+
+class FakeMongoClient:
+    """Just enough of a pymongo client, counting the clients made"""
+
+    made = 0
+
+    def __init__(self, uri = None):
+        FakeMongoClient.made += 1
+        self.database = {"ttt_saves" : FakeCollection()}
+
+    def get_default_database(self):
+        return self.database
+
+
+class CountingStorage(MemoryStorage):
+    """Memory storage counting the gets and puts that reach it"""
+
+    def __init__(self):
+        MemoryStorage.__init__(self)
+        self.gets = self.puts = 0
+
+    def get(self, team_id, channel_id):
+        self.gets += 1
+        return MemoryStorage.get(self, team_id, channel_id)
+
+    def put(self, team_id, channel_id, data):
+        self.puts += 1
+        MemoryStorage.put(self, team_id, channel_id, data)
+
+
+class SlowStorage(CountingStorage):
+    """Counting storage whose reads of one channel wait to be let go"""
+
+    def __init__(self, slow_channel_id):
+        CountingStorage.__init__(self)
+        self.slow_channel_id = slow_channel_id
+        self.reading = threading.Event()
+        self.go = threading.Event()
+
+    def get(self, team_id, channel_id):
+        if channel_id == self.slow_channel_id:
+            self.reading.set()
+            self.go.wait(5)
+        return CountingStorage.get(self, team_id, channel_id)
+
+###
+
+class Test_Storage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        # Without pymongo installed, the fakes stand in for it
+        self.saved_pymongo = getattr(Storage2, "pymongo", None)
+        self.saved_binary  = getattr(Storage2, "Binary", None)
+        Storage2.pymongo = type("pymongo", (), {"MongoClient" : FakeMongoClient})
+        Storage2.Binary  = bytes
+        FakeMongoClient.made = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+        Storage2.pymongo = self.saved_pymongo
+        Storage2.Binary  = self.saved_binary
+        MongoStorage._clients.clear()
+        Storage2._shared.clear()
+
+    def check_storage(self, storage):
+        """Records go in and come back out, by channel"""
+
+        self.assertTrue(storage.get(926, 525) is None,
+                        "Nothing saved yet")
+
+        storage.put(926, 525, b"TTT\x01first")
+        storage.put(926, 136, b"TTT\x01other")
+        storage.put(926, 525, b"TTT\x01second")
+
+        self.assertEqual(storage.get(926, 525), b"TTT\x01second",
+                         "Latest record should be kept")
+        self.assertEqual(storage.get(926, 136), b"TTT\x01other",
+                         "Channels should be kept apart")
+
+    ### EVERY BACKEND KEEPS RECORDS
+    ###
+    ###
+    def test_backends(self):
+
+        self.check_storage(MemoryStorage())
+        self.check_storage(FileStorage(self.directory))
+        self.check_storage(SQLiteStorage(os.path.join(self.directory, "ttt.db")))
+        self.check_storage(MongoStorage("mongodb://fake/ttt", client = FakeMongoClient()))
+
+    ### ONE CLIENT FOR THE PROCESS
+    ###
+    ###
+    def test_shared_mongo_client(self):
+
+        # * Every request makes its storage, but only one client is made
+
+        first  = open_storage("mongodb://fake/shared")
+        second = open_storage("mongodb://fake/shared")
+        first.put(926, 525, b"TTT\x01game")
+
+        self.assertEqual(FakeMongoClient.made, 1,
+                         "Client should be made once")
+        self.assertEqual(second.get(926, 525), b"TTT\x01game",
+                         "Storages should share the client")
+
+        self.assertTrue(shared_storage("mongodb://fake/shared") is shared_storage("mongodb://fake/shared"),
+                        "Storage for a URL should be shared")
+
+    ### CONFIGURATION
+    ###
+    ###
+    def test_urls(self):
+
+        self.assertTrue(isinstance(open_storage("memory:"), MemoryStorage),
+                        "memory: should keep games in memory")
+        self.assertEqual(open_storage("file:" + self.directory).directory, self.directory,
+                         "file: should keep games in the directory")
+        self.assertEqual(open_storage("file:").directory, ".",
+                         "file: alone should keep games here")
+        self.assertTrue(isinstance(open_storage("sqlite::memory:"), SQLiteStorage),
+                        "sqlite: should keep games in a database")
+
+        with self.assertRaises(ValueError) as context:
+            open_storage("floppy:A")
+
+    ### A GAME IN MEMORY
+    ###
+    ###
+    def test_game_in_memory(self):
+
+        USER_TED   = User(user_id = 'AB128', user_name = 'Ted')
+        USER_ALICE = User(user_id = 'CD256', user_name = 'Alice')
+        CHANNEL    = Channel(7890,1234)
+        storage    = MemoryStorage()
+
+        # * Ted and Alice play without touching the disk
+
+        ttt = TTT(channel = CHANNEL, player_X = USER_TED, player_O = USER_ALICE, storage = storage)
+        ttt.play(5)
+
+        loaded = TTT(CHANNEL, None, None, storage = storage)
+        loaded.load()
+
+        self.assertEqual(ttt.get_board(), loaded.get_board(),
+                         "Board does not match after load")
+        self.assertEqual(loaded.next_turn.name, 'Alice',
+                         "Alice should be next after load")
+
+        # * A channel with nothing saved has no game
+
+        empty = TTT(Channel(7890,9999), None, None, storage = storage)
+        empty.load()
+        self.assertTrue(empty.next_turn is None,
+                        "No game in a new channel")
+
+    ### CACHED GAMES
+    ###
+    ###
+    def test_cache(self):
+
+        behind = CountingStorage()
+        behind.put(926, 525, b"TTT\x01saved")
+        behind.puts = 0
+        cached = CachedStorage(behind, size = 2, delay = 60)
+
+        self.check_storage(CachedStorage(MemoryStorage(), delay = 60))
+
+        # * Reading a game again doesn't touch the storage behind
+
+        for read in range(5):
+            self.assertEqual(cached.get(926, 525), b"TTT\x01saved",
+                             "Cached record should match")
+        self.assertEqual(behind.gets, 1,
+                         "Only the first read should reach storage")
+
+        # * Saves wait to be written out
+
+        cached.put(926, 525, b"TTT\x01moved")
+        self.assertEqual(cached.get(926, 525), b"TTT\x01moved",
+                         "Save should be seen straight away")
+        self.assertEqual(behind.get(926, 525), b"TTT\x01saved",
+                         "Save should not be written yet")
+
+        cached.flush()
+        self.assertEqual(behind.get(926, 525), b"TTT\x01moved",
+                         "Save should be written by flush")
+
+        # * The least recently used game is forgotten, unless it's
+        # * still to be written out
+
+        cached.put(926, 136, b"TTT\x01other")
+        cached.put(926, 777, b"TTT\x01third")
+        cached.get(926, 888)
+        self.assertEqual(len(cached._games), 3,
+                         "Unwritten game should be kept")
+        cached.flush()
+        cached.get(926, 999)
+        self.assertEqual(len(cached._games), 2,
+                         "Written games can be forgotten")
+        self.assertEqual(behind.get(926, 136), b"TTT\x01other",
+                         "Forgotten game should have been written")
+
+        # * Saves are written behind without a flush
+
+        cached = CachedStorage(behind, delay = 0)
+        cached.put(926, 525, b"TTT\x01behind")
+        for wait in range(100):
+            if behind.get(926, 525) == b"TTT\x01behind":
+                break
+            time.sleep(0.01)
+        self.assertEqual(behind.get(926, 525), b"TTT\x01behind",
+                         "Save should be written behind")
+
+    ### READING IN WITHOUT HOLDING UP OTHER GAMES
+    ###
+    ###
+    def test_cache_reads(self):
+
+        behind = SlowStorage(525)
+        behind.put(926, 136, b"TTT\x01other")
+        cached = CachedStorage(behind, size = 1, delay = 60)
+
+        # * Other games are read while one waits on the storage behind
+
+        results = []
+        readers = [threading.Thread(target = lambda: results.append(cached.get(926, 525)))
+                   for reader in range(2)]
+        for reader in readers:
+            reader.start()
+        self.assertTrue(behind.reading.wait(5), "Slow read should have started")
+        self.assertEqual(cached.get(926, 136), b"TTT\x01other",
+                         "Other game should not wait")
+        self.assertEqual(results, [], "Slow read should still be waiting")
+
+        # * Requests for the same game wait for the one read
+
+        behind.go.set()
+        for reader in readers:
+            reader.join(5)
+        self.assertEqual(results, [None, None], "Both readers should be answered")
+        self.assertEqual(behind.gets, 2, "The slow game should be read once")
+
+        # * A game forgotten and read in again gets a version never
+        # * handed out before, so a stale save still clashes
+
+        data, stale = cached.get_versioned(926, 136)
+        cached.put_versioned(926, 136, b"TTT\x01moved", stale)
+        cached.flush()
+        cached.get(926, 525)
+        self.assertEqual(list(cached._games), [(926, 525)], "Saved game should be forgotten")
+
+        data, version = cached.get_versioned(926, 136)
+        self.assertEqual(data, b"TTT\x01moved", "Save should be read back")
+        with self.assertRaises(ConflictError):
+            cached.put_versioned(926, 136, b"TTT\x01stale", stale)
+        cached.put_versioned(926, 136, b"TTT\x01again", version)
+
+    ### CLASHING SAVES
+    ###
+    ###
+    def test_conflict(self):
+
+        USER_TED   = User(user_id = 'AB128', user_name = 'Ted')
+        USER_ALICE = User(user_id = 'CD256', user_name = 'Alice')
+        CHANNEL    = Channel(7890,1234)
+        storage    = CachedStorage(MemoryStorage(), delay = 60)
+
+        ttt = TTT(channel = CHANNEL, player_X = USER_TED, player_O = USER_ALICE, storage = storage)
+        ttt.save()
+
+        # * Two requests load the game; the first to save wins
+
+        first  = TTT(CHANNEL, None, None, storage = storage)
+        second = TTT(CHANNEL, None, None, storage = storage)
+        first.load()
+        second.load()
+
+        first.play_at(USER_TED, 5)
+        first.save()
+
+        second.play_at(USER_TED, 1)
+        with self.assertRaises(ConflictError) as context:
+            second.save()
+
+        loaded = TTT(CHANNEL, None, None, storage = storage)
+        loaded.load()
+        self.assertEqual(loaded.symbol_at(5), 'X',
+                         "First save should be kept")
+        self.assertTrue(loaded.symbol_at(1) is None,
+                         "Clashing save should not be kept")
+
+        # * Once saved, the game can carry on
+
+        loaded.play_at(USER_ALICE, 1)
+        loaded.save()
+        loaded.play_at(USER_TED, 9)
+        loaded.save()
+
+#
+
+if __name__ == '__main__':
+    unittest.main()
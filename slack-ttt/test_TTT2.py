@@ -1,6 +1,7 @@
 #!/usr/bin/env python2
 """Test cases for TTT class"""
 
+import pickle
 import unittest
 
 from TTT2     import (TTT, NotYourTurnError, InvalidLocationError, InvalidUserError)
@@ -385,7 +386,103 @@ class Test_TTT(unittest.TestCase):
         self.assertEqual(game, ttt.get_board(),
                          "T.J. and Alice game does not match")
 
-        
+
+    ### A GAME FROM BEFORE
+    ###
+    ###
+    def test_saved_before_bitboards(self):
+
+        USER_BOB   = 731
+        USER_CAROL = 205
+        CHANNEL    = Channel(926,777)
+
+        # * Carol and Bob's game was saved when the board was a list of moves
+
+        ttt = TTT(channel = CHANNEL, player_X = USER_CAROL, player_O = USER_BOB)
+        del ttt._x_bits, ttt._o_bits
+        ttt._moves = ["X", None, None,
+                      None, "O",  None,
+                      None, None, None]
+        ttt._storage = None
+        data_file = open("ttt-926-777.save", "w")
+        data_file.write(pickle.dumps(ttt))
+        data_file.close()
+
+        # * It picks up where it left off
+
+        ttt = TTT(CHANNEL, None, None)
+        ttt.load()
+
+        game = """
+ X |   |  
+---+---+---
+   | O |  
+---+---+---
+   |   |  
+"""
+        self.assertEqual(game, ttt.get_board(),
+                         "Board from the old save does not match")
+
+        with self.assertRaises(InvalidLocationError) as context:
+            ttt.play_at(USER_CAROL, 5)
+
+        # * And Carol wins down the left side
+
+        ttt.play(4)
+        ttt.play(9)
+        ttt.play(7)
+
+        self.assertTrue(ttt.game_over,
+                        "Game should be over")
+        self.assertEqual(ttt.winner, USER_CAROL,
+                         "Carol should be the winner")
+
+        # * No space outside the board can be played
+
+        ttt = TTT(channel = CHANNEL, player_X = USER_CAROL, player_O = USER_BOB)
+        for location in (0, 10):
+            with self.assertRaises(InvalidLocationError) as context:
+                ttt.play_at(USER_CAROL, location)
+
+    ### SMALL SAVES
+    ###
+    ###
+    def test_compact_record(self):
+
+        USER_TED   = User(user_id = 'AB128', user_name = 'Ted')
+        USER_ALICE = User(user_id = 'CD256', user_name = 'Alice')
+        CHANNEL    = Channel(7890,4321)
+
+        # * Ted beats Alice across the top
+
+        ttt = TTT(channel = CHANNEL, player_X = USER_TED, player_O = USER_ALICE)
+        for location in (1, 4, 2, 5, 3):
+            ttt.play(location)
+
+        # * The saved game is a tenth the size of the pickled game
+
+        ttt._storage = None
+        self.assertTrue(10 * len(ttt.to_record()) <= len(pickle.dumps(ttt, 0)),
+                        "Record should be much smaller than a pickle")
+
+        # * And everything comes back
+
+        loaded = TTT(CHANNEL, None, None)
+        loaded.load()
+
+        self.assertEqual(ttt.get_board(), loaded.get_board(),
+                         "Board does not match after load")
+        self.assertEqual((loaded.player_X.id, loaded.player_X.name), ('AB128', 'Ted'),
+                         "X player does not match after load")
+        self.assertEqual((loaded.player_O.id, loaded.player_O.name), ('CD256', 'Alice'),
+                         "O player does not match after load")
+        self.assertTrue(loaded.game_over,
+                        "Game should be over after load")
+        self.assertTrue(loaded.winner is loaded.player_X,
+                        "Ted should be the winner after load")
+        self.assertTrue(loaded.next_turn is None,
+                        "Nobody plays after a win")
+
 #
 
 if __name__ == '__main__':
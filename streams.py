@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Seedable, splittable streams of random numbers
+
+A Stream is a random.Random seeded from a root seed plus a path of
+child numbers, in the style of a seed sequence. Splitting a stream
+gives each parallel worker its own independent generator, and a whole
+run can be replayed just from the root seed.
+"""
+
+import hashlib
+import random
+
+class Stream(random.Random):
+    """A random number generator that can hand out independent children"""
+
+    def __new__(cls, seed=None, path=()):
+        # Python 2's generator type won't accept the extra path argument
+        return random.Random.__new__(cls)
+
+    def __init__(self, seed=None, path=()):
+        """Start a stream, parameters are:
+
+        seed: the root seed of the run, or None to pick one at random
+        path: child numbers leading from the root to this stream
+        """
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(128)
+
+        self.root_seed = seed
+        self.path = tuple(path)
+        self._children = 0
+
+        random.Random.__init__(self, Stream.derive(seed, self.path))
+
+    @staticmethod
+    def derive(seed, path):
+        """Hash a root seed and path into the seed for one stream"""
+        key = ":".join(str(part) for part in (seed,) + tuple(path))
+        return int(hashlib.sha256(key.encode("utf-8")).hexdigest(), 16)
+
+    def spawn(self):
+        """Return the next independent child stream"""
+        child = Stream(self.root_seed, self.path + (self._children,))
+        self._children += 1
+        return child
+
+    def split(self, count):
+        """Return a list of independent child streams, one per worker"""
+        return [self.spawn() for _ in range(count)]
+
+    # random.Random pickles only its generator state, so keep the seed
+    # and path with it for streams sent to worker processes
+
+    def __reduce__(self):
+        return (Stream, (self.root_seed, self.path), (self.getstate(), self._children))
+
+    def __setstate__(self, state):
+        self.setstate(state[0])
+        self._children = state[1]
+
+###
+
+import pickle
+import unittest
+
+class TestStream(unittest.TestCase):
+
+    def test_replay(self):
+        first = Stream(1234)
+        second = Stream(1234)
+        self.assertEqual([first.random() for _ in range(5)],
+                         [second.random() for _ in range(5)],
+                         "Same seed should replay the same numbers")
+
+        self.assertNotEqual(Stream(1234).random(), Stream(4321).random(),
+                            "Different seeds should differ")
+
+        self.assertNotEqual(Stream().root_seed, Stream().root_seed,
+                            "Unseeded streams pick their own seed")
+
+    def test_split(self):
+        children = Stream(99).split(3)
+        self.assertEqual([c.path for c in children], [(0,), (1,), (2,)],
+                         "Children are numbered in order")
+        self.assertEqual(len(set(c.random() for c in children)), 3,
+                         "Children should be independent")
+
+        again = Stream(99).split(3)
+        self.assertEqual(Stream(99, (2,)).random(), again[2].random(),
+                         "Children should replay from the root seed")
+
+        grandchild = again[0].spawn()
+        self.assertEqual(grandchild.path, (0, 0), "Paths nest")
+
+    def test_pickle(self):
+        stream = Stream(5)
+        stream.spawn()
+        stream.random()
+
+        copy = pickle.loads(pickle.dumps(stream))
+        self.assertEqual((copy.root_seed, copy.path), (5, ()), "Seed and path kept")
+        self.assertEqual(copy.random(), stream.random(), "Generator state kept")
+        self.assertEqual(copy.spawn().path, stream.spawn().path, "Child count kept")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,7 +8,9 @@ from turtle import Turtle
 class Tree:
     """A Tree is a trunk segment with 0..N recursive-randomly placed branch segments"""
 
-    def __init__(self):
+    def __init__(self, rng=None):
+        """Optionally pass a random.Random (or similar) to grow the same tree again"""
+        self._rng = rng or random
         self._trunk = None
         self.segments = []    # for redrawing/overdrawing
         self._points = set()  # all vertices
@@ -84,7 +86,7 @@ class Tree:
             # branches are going to be growing, and then add or
             # subtract an amount from the turtle's original angle.
             #
-            branches = random.randint(2, 5)
+            branches = self._rng.randint(2, 5)
             min_angle = 75//branches
             max_angle = 90//branches
             start_heading = my_turtle.heading()
@@ -96,9 +98,9 @@ class Tree:
                 my_turtle.setheading(start_heading)
                 my_turtle.pendown()
                 if branch <= branches/2:
-                    my_turtle.right(random.randint(min_angle, max_angle) * branch)
+                    my_turtle.right(self._rng.randint(min_angle, max_angle) * branch)
                 else:
-                    my_turtle.left(random.randint(min_angle, max_angle) * branch)
+                    my_turtle.left(self._rng.randint(min_angle, max_angle) * branch)
 
                 my_turtle.forward(self._trunk/(iteration+1))
 
@@ -2,12 +2,17 @@
 """
 Bingo card maker for play-along-with-TV
 
-cat list_of_positions | tv_bingo.py > tab_delimited.txt
+cat list_of_positions | tv_bingo.py [seed] > tab_delimited.txt
 
+The seed used is reported on stderr, so a set of cards can be made again.
 """
-import random
 import sys
 
+from streams import Stream
+
+rng = Stream(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+print("seed: {}".format(rng.root_seed), file=sys.stderr)
+
 entries = set()
 for raw in sys.stdin:
     raw = raw.strip()
@@ -16,8 +21,8 @@ for raw in sys.stdin:
     entries.add(raw)
 
 for _ in range(4):
-    pool = list(entries)
-    random.shuffle(pool)
+    pool = sorted(entries)  # set order varies between runs
+    rng.shuffle(pool)
 
     for l in range(5):
         for c in range(4):